@@ -0,0 +1,473 @@
+"""asyncio engine serving the same routes and responses as ChatHandler."""
+
+import asyncio
+import functools
+import json
+import socket
+from email.utils import formatdate
+from http import HTTPStatus
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from agent_chatroom import server
+from agent_chatroom.compression import compress_chunks, negotiate, stream_encoder
+from agent_chatroom.fanout import FanOut, SlowConsumer
+from agent_chatroom.ratelimit import RateLimiter
+from agent_chatroom.rooms import RoomRegistry
+
+KEEPALIVE_INTERVAL = 15.0
+# Anything else gets 501, as BaseHTTPRequestHandler answers for a missing do_*
+METHODS = ('GET', 'POST', 'DELETE', 'OPTIONS')
+
+
+class AsyncChatServer:
+    """HTTP/1.1 server on asyncio streams, using only the stdlib.
+
+    Every connection, including SSE streams and long-polls, is a coroutine
+    on one event loop, so idle listeners cost no threads. Route handling
+    goes through the same helpers as :class:`server.ChatHandler`, so JSON
+    bodies are byte-for-byte identical. Exposes ``serve_forever`` and
+    ``shutdown`` like ``HTTPServer``; the socket is bound on construction.
+
+    The rooms it serves, the admin password and the rate limiter are
+    passed in rather than read from :mod:`server`'s globals, which belong
+    to a different module object when the server runs as ``__main__``.
+    ``sequenced`` is set when serving with ``--workers``.
+    """
+
+    def __init__(self, address: tuple[str, int], rooms: RoomRegistry, admin_password: str,
+                 rate_limiter: Optional[RateLimiter] = None, sequenced: bool = False,
+                 reuse_port: bool = False):
+        self.rooms = rooms
+        self.admin_password = admin_password
+        self.rate_limiter = rate_limiter
+        self.sequenced = sequenced
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.bind(address)
+        self.sock.listen(128)
+        self.sock.setblocking(False)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._published: Optional[asyncio.Event] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+    def serve_forever(self):
+        """Run the event loop until :meth:`shutdown` is called."""
+        asyncio.run(self._serve())
+
+    def shutdown(self):
+        """Stop serving; safe to call from any thread or a signal handler."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._published = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self.rooms.add_listener(self._on_publish)
+        srv = await asyncio.start_server(self._handle_connection, sock=self.sock)
+        async with srv:
+            await self._stopped.wait()
+
+    def _on_publish(self):
+        # Called from a room's fan-out dispatcher thread
+        self._loop.call_soon_threadsafe(self._notify)
+
+    def _notify(self):
+        # Wake everyone waiting on the current event and start a new one
+        self._published.set()
+        self._published = asyncio.Event()
+
+    async def _wait_for_messages(self, fanout: FanOut, after_seq: int, timeout: float):
+        """Wait until ``fanout`` publishes past ``after_seq`` or ``timeout``."""
+        deadline = self._loop.time() + timeout
+        while fanout.last_seq <= after_seq and not fanout.closed:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                return
+            published = self._published
+            if fanout.last_seq > after_seq:
+                return
+            try:
+                await asyncio.wait_for(published.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self._send(writer, 400, json.dumps({'error': 'Bad request'}).encode())
+                    break
+                method, target, version = parts
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = headers.get('content-length', '0')
+                if not (length.isascii() and length.isdigit()):
+                    await self._send(writer, 400,
+                                     json.dumps({'error': 'Bad Content-Length'}).encode())
+                    break
+                body = b''
+                length = int(length)
+                if length:
+                    if (version != 'HTTP/1.0'
+                            and headers.get('expect', '').lower() == '100-continue'):
+                        # The client holds the body back until it hears this
+                        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                        await writer.drain()
+                    body = await reader.readexactly(length)
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = (connection == 'keep-alive' if version == 'HTTP/1.0'
+                              else connection != 'close')
+                if not await self._dispatch(method, target, version, headers, body, writer):
+                    break
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, content: bytes = b'',
+                    content_type: Optional[str] = 'application/json', cors: bool = True,
+                    extra_headers: list[tuple[str, str]] = ()):
+        headers = [('Date', formatdate(usegmt=True))]
+        if content_type and status != 304:
+            headers.append(('Content-Type', content_type))
+        if status != 304:
+            headers.append(('Content-Length', str(len(content))))
+        headers.extend(extra_headers)
+        if cors:
+            headers.extend(server.CORS_HEADERS)
+        writer.write(self._head(status, headers) + content)
+        await writer.drain()
+
+    @staticmethod
+    def _head(status: int, headers: list[tuple[str, str]]) -> bytes:
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _dispatch(self, method: str, target: str, version: str, headers: dict,
+                        body: bytes, writer: asyncio.StreamWriter) -> bool:
+        """Handle one request; returns False if the connection must close."""
+        parsed = urlparse(target)
+        path = parsed.path
+        params = parse_qs(parsed.query)
+
+        if method not in METHODS:
+            await self._send(writer, 501, json.dumps(
+                {'error': f'Unsupported method ({method!r})'}).encode(), cors=False)
+            return True
+
+        if method == 'OPTIONS':
+            await self._send(writer, 200, content_type=None)
+            return True
+
+        if path == '/health' and method == 'GET':
+            await self._send(writer, 200, json.dumps({'status': 'ok'}).encode(), cors=False)
+            return True
+
+        pw = server.request_password(headers.get('x-room-password', ''), params)
+        room_id, route_path = server.split_room_path(path)
+
+        if ((path == '/rooms' and method in ('GET', 'POST'))
+                or (method == 'DELETE' and path.startswith('/rooms/') and route_path == '/')):
+            return await self._admin(method, room_id, pw, body, writer)
+
+        room = self.rooms.resident(room_id)
+        if room is not None:
+            room.touch()
+        else:
+            # Loading an evicted room replays its journal; keep that off the loop
+            room = await self._loop.run_in_executor(None, self.rooms.get, room_id)
+        if room is None:
+            await self._send(writer, 404, json.dumps({'error': 'Room not found'}).encode())
+            return True
+
+        routes = {
+            ('GET', '/'): self._web_ui,
+            ('GET', '/messages'): self._messages,
+            ('GET', '/messages/stream'): self._stream,
+            ('GET', '/messages/poll'): self._poll,
+            ('GET', '/stats'): self._stats,
+            ('POST', '/messages'): self._post_message,
+            ('POST', '/messages/batch'): self._post_batch,
+        }
+        route = routes.get((method, route_path))
+        if route is None and method == 'GET' and route_path.startswith(server.PAGES_PREFIX):
+            route = functools.partial(self._page, route_path)
+        if route is None:
+            await self._send(writer, 404, json.dumps({'error': 'Not found'}).encode(), cors=False)
+            return True
+
+        if not server.check_password(pw, room.password):
+            await self._send(writer, 401, json.dumps({'error': 'Invalid password'}).encode())
+            return True
+
+        return await route(room, params, headers, body, writer, version)
+
+    async def _admin(self, method: str, room_id: str, pw: str, body: bytes, writer) -> bool:
+        """List, create or delete rooms."""
+        if not server.check_password(pw, self.admin_password):
+            await self._send(writer, 401, json.dumps({'error': 'Invalid password'}).encode())
+            return True
+        # These list, write and fsync the state dir; keep them off the loop
+        loop = self._loop
+        if method == 'GET':
+            status, payload = 200, await loop.run_in_executor(None, server.rooms_payload, self.rooms)
+        elif method == 'POST':
+            status, payload = await loop.run_in_executor(
+                None, server.create_room, self.rooms, body, self.sequenced)
+        else:
+            status, payload = await loop.run_in_executor(
+                None, server.delete_room, self.rooms, room_id)
+        await self._send(writer, status, json.dumps(payload).encode())
+        return True
+
+    async def _web_ui(self, room, params, headers, body, writer, version) -> bool:
+        await self._send(writer, 200, server.WEB_UI_HTML.encode(), 'text/html; charset=utf-8')
+        return True
+
+    async def _bad_cursor(self, writer) -> bool:
+        await self._send(writer, 400, json.dumps({'error': 'Cursor must be an integer seq'}).encode())
+        return True
+
+    async def _send_chunked(self, writer: asyncio.StreamWriter, status: int, chunks,
+                            extra_headers: list[tuple[str, str]] = ()):
+        """Stream a JSON body with chunked transfer encoding."""
+        writer.write(self._head(status, [('Date', formatdate(usegmt=True)),
+                                         ('Content-Type', 'application/json'),
+                                         ('Transfer-Encoding', 'chunked'),
+                                         *extra_headers, *server.CORS_HEADERS]))
+        for chunk in chunks:
+            if chunk:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def _bad_page(self, writer) -> bool:
+        await self._send(writer, 400, json.dumps({'error': 'limit and tail must be positive integers'}).encode())
+        return True
+
+    async def _messages(self, room, params, headers, body, writer, version) -> bool:
+        try:
+            after_seq, before_seq = server.parse_cursors(params)
+        except ValueError:
+            return await self._bad_cursor(writer)
+        try:
+            limit, tail = server.parse_page(params)
+        except ValueError:
+            return await self._bad_page(writer)
+        etag = server.history_etag(room)
+        if await self._check_etag(etag, headers, writer):
+            return True
+        cache_headers = [('ETag', etag), ('Cache-Control', server.CACHE_REVALIDATE)]
+        encoding = negotiate(headers.get('accept-encoding', ''))
+        entries, end = server.history_page(room, after_seq, before_seq, limit, tail)
+        if server.should_stream(entries) and version == 'HTTP/1.1':
+            chunks = server.history_chunks(entries, end)
+            if encoding:
+                chunks = compress_chunks(chunks, encoding)
+            await self._send_chunked(writer, 200, chunks,
+                                     server.coded_headers(cache_headers, encoding))
+        else:
+            content, extra_headers = server.encode_response(
+                server.history_body(entries, end), cache_headers, encoding)
+            await self._send(writer, 200, content, extra_headers=extra_headers)
+        return True
+
+    async def _check_etag(self, etag: str, headers: dict, writer) -> bool:
+        """Answer 304 if the client already has ``etag``; returns True if it did."""
+        tag = server.matching_etag(headers.get('if-none-match', ''), etag,
+                                   negotiate(headers.get('accept-encoding', '')))
+        if tag:
+            await self._send(writer, 304, extra_headers=server.not_modified_headers(tag))
+            return True
+        return False
+
+    async def _poll(self, room, params, headers, body, writer, version) -> bool:
+        try:
+            after_seq, before_seq = server.parse_cursors(params)
+        except ValueError:
+            return await self._bad_cursor(writer)
+        try:
+            limit, _ = server.parse_page(params)
+        except ValueError:
+            return await self._bad_page(writer)
+        try:
+            wait = server.parse_wait(params)
+        except ValueError:
+            await self._send(writer, 400, json.dumps({'error': 'wait must be a number of seconds'}).encode())
+            return True
+
+        if 0 < wait and after_seq == room.store.last_seq:
+            await self._wait_for_messages(room.fanout, after_seq, wait)
+        etag = server.history_etag(room)
+        if await self._check_etag(etag, headers, writer):
+            return True
+        content, extra_headers = server.encode_response(
+            server.poll_body(room, after_seq, before_seq, limit),
+            [('ETag', etag), ('Cache-Control', server.CACHE_REVALIDATE)],
+            negotiate(headers.get('accept-encoding', '')))
+        await self._send(writer, 200, content, extra_headers=extra_headers)
+        return True
+
+    async def _page(self, route_path, room, params, headers, body, writer, version) -> bool:
+        status, content, extra_headers = server.page_response(
+            room, route_path, params, headers.get('if-none-match', ''),
+            negotiate(headers.get('accept-encoding', '')))
+        await self._send(writer, status, content, extra_headers=extra_headers)
+        return True
+
+    async def _stats(self, room, params, headers, body, writer, version) -> bool:
+        await self._send(writer, 200, json.dumps(server.stats_payload(room, self.rooms, self.rate_limiter)).encode())
+        return True
+
+    async def _post_message(self, room, params, headers, body, writer, version) -> bool:
+        try:
+            item = server.new_message(body)
+        except ValueError as e:
+            await self._send(writer, 400, json.dumps({'error': str(e)}).encode())
+            return True
+        if not await self._check_rate(room, [item], headers, writer):
+            return True
+        try:
+            entries = await self._commit(room, [item])
+        except Exception:
+            await self._send(writer, 500, json.dumps({'error': 'Failed to store message'}).encode())
+            return True
+        await self._send(writer, 200, server.posted_body(entries[0]))
+        return True
+
+    async def _post_batch(self, room, params, headers, body, writer, version) -> bool:
+        try:
+            items = server.new_messages(body)
+        except ValueError as e:
+            await self._send(writer, 400, json.dumps({'error': str(e)}).encode())
+            return True
+        if not await self._check_rate(room, items, headers, writer):
+            return True
+        try:
+            entries = await self._commit(room, items)
+        except Exception:
+            await self._send(writer, 500, json.dumps({'error': 'Failed to store messages'}).encode())
+            return True
+        await self._send(writer, 200, server.batch_posted_body(entries))
+        return True
+
+    async def _check_rate(self, room, items: list, headers: dict, writer) -> bool:
+        """Charge a post to the rate limits, answering 429 if they are spent."""
+        peer = writer.get_extra_info('peername')
+        ip = server.client_ip(peer[0] if peer else '', headers.get('x-forwarded-for', ''))
+        retry_after = server.rate_limit_wait(self.rate_limiter, room, items, ip)
+        if retry_after:
+            payload = {'error': 'Rate limit exceeded', 'retry_after': retry_after}
+            await self._send(writer, 429, json.dumps(payload).encode(),
+                             extra_headers=[('Retry-After', str(retry_after))])
+            return False
+        return True
+
+    async def _commit(self, room, items: list) -> list:
+        """Submit ``items`` to the room's ingest pipeline and await their entries."""
+        loop = self._loop
+        committed = loop.create_future()
+
+        def on_commit(entries, error):
+            # Called from the ingest thread
+            loop.call_soon_threadsafe(_resolve, entries, error)
+
+        def _resolve(entries, error):
+            if committed.done():
+                return
+            if error is not None:
+                committed.set_exception(error)
+            else:
+                committed.set_result(entries)
+
+        room.ingest.submit_many_nowait(items, on_commit)
+        return await committed
+
+    async def _gather_frames(self, room, sub, data: bytes, until: float, max_bytes: int) -> bytes:
+        """Add the frames published before ``until`` (loop time) to ``data``.
+
+        The asyncio counterpart of :func:`server.gather_frames`.
+        """
+        while len(data) < max_bytes:
+            remaining = until - self._loop.time()
+            if remaining <= 0:
+                break
+            published = self._published
+            more = server.read_frames(room, sub, 0)
+            if more:
+                data += more
+                continue
+            try:
+                await asyncio.wait_for(published.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return data
+
+    async def _stream(self, room, params, headers, body, writer, version) -> bool:
+        try:
+            after_seq = server.stream_cursor(params, headers.get('last-event-id', ''))
+        except ValueError:
+            return await self._bad_cursor(writer)
+
+        encoding = server.stream_encoding(params, headers.get('accept-encoding', ''))
+        encode = stream_encoder(encoding)
+        fanout = room.fanout
+        write_timeout = fanout.limits.write_timeout
+        writer.write(self._head(200, [('Date', formatdate(usegmt=True)),
+                                      *server.sse_headers(encoding), *server.CORS_HEADERS]))
+
+        # Subscribe before replaying so nothing falls between replay and live
+        sub = room.subscribe(after_seq)
+        try:
+            data = server.SSE_PREAMBLE
+            if after_seq is not None:
+                data += server.catch_up(room, sub)
+            writer.write(encode(data))
+            await asyncio.wait_for(writer.drain(), write_timeout)
+
+            last_write = 0.0
+            while True:
+                published = self._published
+                try:
+                    data = server.read_frames(room, sub, 0)
+                    if data:
+                        # Right after a write, whatever follows within the
+                        # window goes out together in the next one
+                        data = await self._gather_frames(
+                            room, sub, data, last_write + fanout.limits.coalesce_window,
+                            fanout.limits.coalesce_bytes)
+                except SlowConsumer:
+                    break
+                if not data:
+                    try:
+                        await asyncio.wait_for(published.wait(), KEEPALIVE_INTERVAL)
+                        continue
+                    except asyncio.TimeoutError:
+                        data = server.SSE_KEEPALIVE
+                writer.write(encode(data))
+                await asyncio.wait_for(writer.drain(), write_timeout)
+                last_write = self._loop.time()
+        finally:
+            sub.close()
+        return False
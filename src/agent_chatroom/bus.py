@@ -0,0 +1,209 @@
+"""Local message bus that orders posts across worker processes."""
+
+import itertools
+import os
+import selectors
+import socket
+import struct
+import threading
+from typing import Callable, Optional
+
+from agent_chatroom.journal import Journal
+from agent_chatroom.store import MessageStore, StoredMessage
+
+# Frame header: kind, request id (or seq), payload length
+_HEADER = struct.Struct('!cQI')
+
+# Worker -> sequencer
+HELLO = b'H'  # id is the worker's last seq; the reply catches it up
+POST = b'P'  # payload is encoded messages, one per line
+# Sequencer -> worker
+ENTRIES = b'E'  # payload is `seq stored_at data` lines; id answers a POST (0 if not)
+
+
+def _frame(kind: bytes, ident: int, payload: bytes = b'') -> bytes:
+    return _HEADER.pack(kind, ident, len(payload)) + payload
+
+
+def _encode_entries(entries: list[StoredMessage]) -> bytes:
+    return b'\n'.join(b'%d %r ' % (entry.seq, entry.stored_at) + entry.data
+                      for entry in entries)
+
+
+def _decode_entries(payload: bytes) -> list[StoredMessage]:
+    entries = []
+    for record in payload.split(b'\n'):
+        seq, stored_at, data = record.split(b' ', 2)
+        entries.append(StoredMessage(int(seq), data, float(stored_at)))
+    return entries
+
+
+class Sequencer:
+    """Assigns seqs for every worker process and broadcasts the results.
+
+    Workers connect over a Unix socket and send their posts here. Each post
+    batch is appended to ``store``, which assigns the seqs, then to
+    ``journal``, then broadcast to every worker in that order. All workers
+    therefore hold the same messages under the same seqs, whichever of them
+    received the post.
+
+    A worker gets broadcasts only once it has sent HELLO and been caught
+    up, so none can overtake its catch-up and leave a gap in its history.
+    """
+
+    def __init__(self, path: str, store: MessageStore, journal: Optional[Journal] = None):
+        self.path = path
+        self.store = store
+        self.journal = journal
+        if os.path.exists(path):
+            os.unlink(path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(path)
+        self._listener.listen(64)
+        self._selector = selectors.DefaultSelector()
+        self._buffers: dict[socket.socket, bytearray] = {}
+        self._caught_up: set[socket.socket] = set()  # workers that sent HELLO
+        self.batches = 0
+
+    def serve_forever(self):
+        """Accept workers and sequence their posts until the process exits."""
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        while True:
+            for key, _ in self._selector.select():
+                if key.fileobj is self._listener:
+                    conn, _ = self._listener.accept()
+                    self._buffers[conn] = bytearray()
+                    self._selector.register(conn, selectors.EVENT_READ)
+                else:
+                    self._on_readable(key.fileobj)
+
+    def close(self):
+        """Stop listening; called in forked workers and on shutdown."""
+        self._listener.close()
+
+    def _on_readable(self, conn: socket.socket):
+        try:
+            data = conn.recv(1 << 20)
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(conn)
+            return
+        buf = self._buffers[conn]
+        buf += data
+        while len(buf) >= _HEADER.size:
+            kind, ident, length = _HEADER.unpack_from(buf)
+            end = _HEADER.size + length
+            if len(buf) < end:
+                break
+            payload = bytes(buf[_HEADER.size:end])
+            del buf[:end]
+            if kind == HELLO:
+                backlog = self.store.read(ident)
+                if backlog:
+                    self._send(conn, _frame(ENTRIES, 0, _encode_entries(backlog)))
+                if conn in self._buffers:
+                    self._caught_up.add(conn)
+            elif kind == POST:
+                self._commit(conn, ident, payload.split(b'\n'))
+
+    def _commit(self, origin: socket.socket, req_id: int, datas: list[bytes]):
+        entries = self.store.extend(datas)
+        if self.journal:
+            self.journal.append(entries)
+        self.batches += 1
+        # Encoded once; only the header differs between workers
+        payload = _encode_entries(entries)
+        for conn in list(self._caught_up):
+            self._send(conn, _frame(ENTRIES, req_id if conn is origin else 0, payload))
+
+    def _send(self, conn: socket.socket, data: bytes):
+        try:
+            conn.sendall(data)
+        except OSError:
+            self._drop(conn)
+
+    def _drop(self, conn: socket.socket):
+        if self._buffers.pop(conn, None) is not None:
+            self._caught_up.discard(conn)
+            self._selector.unregister(conn)
+            conn.close()
+
+
+class BusClient:
+    """A worker's connection to the :class:`Sequencer`.
+
+    Every batch the sequencer broadcasts, including this worker's own, is
+    passed to ``apply`` from a reader thread in seq order. If the sequencer
+    goes away, pending commits fail and ``on_disconnect`` is called.
+    """
+
+    def __init__(self, path: str, apply: Callable[[list[StoredMessage]], None],
+                 on_disconnect: Optional[Callable[[], None]] = None):
+        self.apply = apply
+        self.on_disconnect = on_disconnect
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: dict[int, list] = {}  # id -> [done event, entries]
+        self._pending_lock = threading.Lock()
+        self._closed = False
+
+    def start(self, last_seq: int):
+        """Catch up from ``last_seq`` and start applying broadcasts.
+
+        Call before :meth:`commit`; the sequencer sends a worker nothing
+        until it has caught it up.
+        """
+        self._send(_frame(HELLO, last_seq))
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def commit(self, datas: list[bytes]) -> list[StoredMessage]:
+        """Sequence encoded messages; returns their entries once applied here."""
+        req_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        with self._pending_lock:
+            if self._closed:
+                raise ConnectionError("message bus closed")
+            self._pending[req_id] = waiter
+        self._send(_frame(POST, req_id, b'\n'.join(datas)))
+        waiter[0].wait()
+        if waiter[1] is None:
+            raise ConnectionError("message bus closed")
+        return waiter[1]
+
+    def _send(self, data: bytes):
+        with self._send_lock:
+            self._sock.sendall(data)
+
+    def _run(self):
+        reader = self._sock.makefile('rb')
+        try:
+            while True:
+                header = reader.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                kind, ident, length = _HEADER.unpack(header)
+                payload = reader.read(length)
+                if len(payload) < length:
+                    break
+                if kind != ENTRIES:
+                    continue
+                entries = _decode_entries(payload)
+                self.apply(entries)
+                if ident:
+                    with self._pending_lock:
+                        waiter = self._pending.pop(ident, None)
+                    if waiter:
+                        waiter[1] = entries
+                        waiter[0].set()
+        except OSError:
+            pass
+        with self._pending_lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            waiter[0].set()
+        if self.on_disconnect:
+            self.on_disconnect()
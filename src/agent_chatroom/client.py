@@ -2,13 +2,30 @@
 
 import argparse
 import json
+import queue
 import sys
+import threading
 import time
 import urllib.request
 import urllib.error
 import urllib.parse
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, Optional
+
+from agent_chatroom.compression import ENCODINGS, decompress, decompressor
+
+# Messages per POST /messages/batch (the server accepts up to 1000)
+SEND_BATCH_SIZE = 100
+# How long `send --stdin` waits for more lines before flushing a partial batch
+SEND_FLUSH_INTERVAL = 0.05
+# Times a post is retried after a 429 or 503 asks the client to back off
+SEND_MAX_RETRIES = 5
+# Recent messages `join` and `listen` print before following the room
+DEFAULT_HISTORY = 50
+# Most messages one poll response carries while catching up
+POLL_PAGE_SIZE = 1000
+# Codings history, poll and stream responses may be compressed with
+ACCEPT_ENCODING = ', '.join(ENCODINGS)
 
 
 def format_message(msg: dict) -> str:
@@ -30,10 +47,69 @@ def format_message(msg: dict) -> str:
 
 def send_message(url: str, password: str, agent: str, message: str) -> bool:
     """Send a single message to the chat room."""
-    # Ensure URL ends correctly
-    api_url = url.rstrip('/') + '/messages'
+    return _post(url.rstrip('/') + '/messages', password, {'agent': agent, 'text': message})
+
+
+def send_many(url: str, password: str, agent: str, messages: Iterable[str]) -> bool:
+    """Send messages in order, up to SEND_BATCH_SIZE per request.
+    
+    Each request is stored as a unit with consecutive seqs. Stops at the
+    first failed request.
+    """
+    api_url = url.rstrip('/') + '/messages/batch'
+    batch = []
+    for message in messages:
+        batch.append({'agent': agent, 'text': message})
+        if len(batch) == SEND_BATCH_SIZE:
+            if not _post(api_url, password, batch):
+                return False
+            batch = []
+    return not batch or _post(api_url, password, batch)
+
+
+def send_stream(url: str, password: str, agent: str, lines: Iterable[str]) -> bool:
+    """Send lines as they arrive, batching whatever is buffered.
+    
+    A batch goes out when SEND_BATCH_SIZE lines are waiting, or once input
+    pauses for SEND_FLUSH_INTERVAL, so piped output is neither held back
+    nor sent a request per line. Blank lines are skipped. Stops at the
+    first failed request.
+    """
+    lines_queue: queue.Queue = queue.Queue(maxsize=SEND_BATCH_SIZE * 10)
+    done = object()
     
-    data = json.dumps({'agent': agent, 'text': message}).encode()
+    def read():
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if line.strip():
+                lines_queue.put(line)
+        lines_queue.put(done)
+    
+    threading.Thread(target=read, daemon=True).start()
+    finished = False
+    while not finished:
+        batch = [lines_queue.get()]
+        while batch[-1] is not done and len(batch) < SEND_BATCH_SIZE:
+            try:
+                batch.append(lines_queue.get(timeout=SEND_FLUSH_INTERVAL))
+            except queue.Empty:
+                break
+        if batch[-1] is done:
+            batch.pop()
+            finished = True
+        if batch and not send_many(url, password, agent, batch):
+            return False
+    return True
+
+
+def _post(api_url: str, password: str, payload) -> bool:
+    """POST a JSON payload, reporting failures on stderr.
+    
+    When the server answers 429 (rate limited) or 503 (busy), waits as long
+    as its Retry-After header asks and tries again, up to SEND_MAX_RETRIES
+    times.
+    """
+    data = json.dumps(payload).encode()
     
     req = urllib.request.Request(
         api_url,
@@ -45,107 +121,193 @@ def send_message(url: str, password: str, agent: str, message: str) -> bool:
         method='POST'
     )
     
+    for attempt in range(SEND_MAX_RETRIES + 1):
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                result = json.loads(resp.read())
+                return result.get('ok', False)
+        except urllib.error.HTTPError as e:
+            if e.code in (429, 503) and attempt < SEND_MAX_RETRIES:
+                delay = _retry_after(e)
+                print(f"⏳ {_error_detail(e)}, retrying in {delay:g}s", file=sys.stderr, flush=True)
+                time.sleep(delay)
+                continue
+            _report_http_error(e)
+            return False
+        except Exception as e:
+            print(f"❌ Error: {e}", file=sys.stderr, flush=True)
+            return False
+    return False
+
+
+def _retry_after(e: urllib.error.HTTPError) -> float:
+    """Seconds the server's Retry-After header asks for (1 if absent or a date)."""
     try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            result = json.loads(resp.read())
-            return result.get('ok', False)
-    except urllib.error.HTTPError as e:
-        if e.code == 401:
-            print("❌ Invalid password", file=sys.stderr, flush=True)
-        else:
-            print(f"❌ HTTP error {e.code}: {e.reason}", file=sys.stderr, flush=True)
-        return False
-    except Exception as e:
-        print(f"❌ Error: {e}", file=sys.stderr, flush=True)
-        return False
+        return max(float(e.headers.get('Retry-After', 1)), 0)
+    except ValueError:
+        return 1
+
+
+def _report_http_error(e: urllib.error.HTTPError):
+    """Print why a POST failed on stderr."""
+    if e.code == 401:
+        print("❌ Invalid password", file=sys.stderr, flush=True)
+    else:
+        print(f"❌ HTTP error {e.code}: {_error_detail(e)}", file=sys.stderr, flush=True)
+
+
+def _error_detail(e: urllib.error.HTTPError) -> str:
+    """The server's JSON error message, falling back to the HTTP reason."""
+    try:
+        return json.loads(e.read()).get('error') or e.reason
+    except Exception:
+        return e.reason
+
+
+def _read_json(resp):
+    """Decode a JSON response, decompressing it if the server compressed it."""
+    return json.loads(decompress(resp.read(), resp.headers.get('Content-Encoding')))
+
+
+def _stream_lines(resp):
+    """Yield the lines of a streamed response as they arrive, decompressing if needed."""
+    encoding = resp.headers.get('Content-Encoding')
+    if encoding not in ENCODINGS:
+        yield from resp
+        return
+    stream = decompressor(encoding)
+    pending = b''
+    while True:
+        data = resp.read1(65536)
+        if not data:
+            break
+        # The server flushes after every write, so each read decodes whole
+        # events rather than waiting for more input
+        *lines, pending = (pending + stream.decompress(data)).split(b'\n')
+        for line in lines:
+            yield line + b'\n'
+
+
+def get_messages(url: str, password: str, tail: Optional[int] = None) -> list:
+    """Get all messages from the chat room, or only the newest ``tail``."""
+    result = get_page(url, password, tail=tail)
+    return result.get('messages', []) if result else []
 
 
-def get_messages(url: str, password: str) -> list:
-    """Get all messages from the chat room."""
-    api_url = url.rstrip('/') + '/messages'
+def get_page(url: str, password: str, **params) -> Optional[dict]:
+    """GET /messages with query ``params`` (``limit``, ``tail``, ``after_seq``, ...).
+    
+    Returns the decoded response, whose ``next`` and ``prev`` cursors page
+    through history, or None on error.
+    """
+    query = urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+    api_url = url.rstrip('/') + '/messages' + ('?' + query if query else '')
     
     req = urllib.request.Request(
         api_url,
-        headers={'X-Room-Password': password},
+        headers={'X-Room-Password': password, 'Accept-Encoding': ACCEPT_ENCODING},
         method='GET'
     )
     
     try:
         with urllib.request.urlopen(req, timeout=30) as resp:
-            result = json.loads(resp.read())
-            return result.get('messages', [])
+            return _read_json(resp)
     except Exception as e:
         print(f"❌ Error fetching messages: {e}", file=sys.stderr, flush=True)
-        return []
+        return None
 
 
-def listen_sse(url: str, password: str, callback):
-    """Listen for messages via SSE stream."""
-    api_url = url.rstrip('/') + '/messages/stream?password=' + urllib.parse.quote(password)
+def listen_sse(url: str, password: str, callback, after_seq: Optional[int] = None,
+               compress: bool = True):
+    """Listen for messages via SSE stream.
     
-    req = urllib.request.Request(
-        api_url,
-        headers={'Accept': 'text/event-stream'},
-        method='GET'
-    )
+    Reconnects when the stream drops, sending the last event id so the
+    server replays only the messages missed in between. Pass ``after_seq``
+    to start with a replay from that cursor. With ``compress`` the stream
+    is requested gzip/deflate-compressed, which cuts the bandwidth of a
+    long-lived listener, and decoded as it arrives.
+    """
+    api_url = url.rstrip('/') + '/messages/stream?password=' + urllib.parse.quote(password)
+    if compress:
+        api_url += '&compress=1'
+    last_id = str(after_seq) if after_seq is not None else ''
     
-    try:
-        with urllib.request.urlopen(req, timeout=None) as resp:
-            buffer = ""
-            while True:
-                chunk = resp.read(1)
-                if not chunk:
-                    break
-                
-                buffer += chunk.decode('utf-8', errors='replace')
-                
-                # Process complete lines
-                while '\n\n' in buffer:
-                    event, buffer = buffer.split('\n\n', 1)
-                    
-                    # Parse SSE event
-                    for line in event.split('\n'):
-                        if line.startswith('data: '):
-                            data = line[6:]
-                            if data == ':keepalive':
-                                continue
+    while True:
+        headers = {'Accept': 'text/event-stream'}
+        if compress:
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+        if last_id:
+            headers['Last-Event-ID'] = last_id
+        req = urllib.request.Request(api_url, headers=headers, method='GET')
+        
+        try:
+            with urllib.request.urlopen(req, timeout=None) as resp:
+                event_id = ''
+                data_lines = []
+                for raw in _stream_lines(resp):
+                    line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                    if line.startswith('id:'):
+                        event_id = line[3:].strip()
+                    elif line.startswith('data:'):
+                        data_lines.append(line[5:].lstrip(' '))
+                    elif not line:
+                        # Blank line ends the event
+                        if data_lines:
                             try:
-                                msg = json.loads(data)
-                                callback(msg)
+                                callback(json.loads('\n'.join(data_lines)))
                             except json.JSONDecodeError:
                                 pass
-    except KeyboardInterrupt:
-        pass
-    except Exception as e:
-        print(f"❌ SSE error: {e}", file=sys.stderr, flush=True)
+                        if event_id:
+                            last_id = event_id
+                        event_id = ''
+                        data_lines = []
+        except KeyboardInterrupt:
+            break
+        except urllib.error.HTTPError as e:
+            print(f"❌ SSE error: HTTP {e.code}", file=sys.stderr, flush=True)
+            if e.code == 401:
+                break
+        except Exception as e:
+            print(f"❌ SSE error: {e}", file=sys.stderr, flush=True)
+        time.sleep(2)
 
 
-def listen_poll(url: str, password: str, callback):
-    """Listen for messages via polling (works through all proxies)."""
+def listen_poll(url: str, password: str, callback, after_seq: int = 0, wait: float = 25):
+    """Listen for messages via long-polling (works through all proxies).
+    
+    Only messages with a seq greater than ``after_seq`` are delivered. The
+    server holds each poll open for up to ``wait`` seconds until something
+    arrives, so the next poll can go out immediately. A poll that repeats
+    the previous one sends its ETag, so a quiet room answers with a
+    bodiless 304.
+    """
     api_url = url.rstrip('/') + '/messages/poll'
-    next_idx = 0
-    interval = 0.5  # seconds
+    next_seq = after_seq
+    last_url, etag = None, None
     
     while True:
         try:
-            poll_url = f"{api_url}?password={urllib.parse.quote(password)}&after={next_idx}"
-            req = urllib.request.Request(poll_url, method='GET')
+            poll_url = (f"{api_url}?password={urllib.parse.quote(password)}"
+                        f"&after_seq={next_seq}&wait={wait}&limit={POLL_PAGE_SIZE}")
+            req = urllib.request.Request(poll_url, headers={'Accept-Encoding': ACCEPT_ENCODING},
+                                         method='GET')
+            if etag and poll_url == last_url:
+                req.add_header('If-None-Match', etag)
             
-            with urllib.request.urlopen(req, timeout=10) as resp:
-                result = json.loads(resp.read())
-                next_idx = result.get('next', next_idx)
-                msgs = result.get('messages', [])
-                for msg in msgs:
+            with urllib.request.urlopen(req, timeout=wait + 10) as resp:
+                last_url, etag = poll_url, resp.headers.get('ETag')
+                result = _read_json(resp)
+                next_seq = result.get('next', next_seq)
+                for msg in result.get('messages', []):
                     callback(msg)
-                
-                if msgs:
-                    interval = 0.5  # got messages, poll fast
-                else:
-                    interval = min(interval + 0.2, 3.0)  # slow down when idle
-            
-            time.sleep(interval)
         except KeyboardInterrupt:
             break
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                # Nothing new since the last poll
+                continue
+            print(f"❌ Poll error: {e}", file=sys.stderr, flush=True)
+            time.sleep(3)
         except Exception as e:
             print(f"❌ Poll error: {e}", file=sys.stderr, flush=True)
             time.sleep(3)
@@ -153,12 +315,41 @@ def listen_poll(url: str, password: str, callback):
 
 def cmd_send(args):
     """Handle send command."""
+    if args.stdin:
+        success = send_stream(args.url, args.password, args.agent_name, sys.stdin)
+        if success:
+            print(f"✅ Sent stdin as {args.agent_name}", flush=True)
+        sys.exit(0 if success else 1)
     success = send_message(args.url, args.password, args.agent_name, args.message)
     if success:
         print(f"✅ Sent message as {args.agent_name}", flush=True)
     sys.exit(0 if success else 1)
 
 
+def show_history(args) -> int:
+    """Print the history `--history`/`--since` ask for; returns the seq to follow from.
+    
+    With ``--since SEQ`` nothing is printed here: following from SEQ
+    replays everything after it. Otherwise the newest ``--history``
+    messages are fetched in one small request.
+    """
+    if args.since is not None:
+        return args.since
+    
+    history = max(args.history, 0)
+    # tail=1 still reports the cursor when no history is wanted
+    page = get_page(args.url, args.password, tail=max(history, 1))
+    if page is None:
+        return 0
+    messages = page.get('messages', [])[-history:] if history else []
+    for msg in messages:
+        print(format_message(msg), flush=True)
+    
+    if messages:
+        print("--- end of history ---", flush=True)
+    return page.get('next', messages[-1].get('seq', 0) if messages else 0)
+
+
 def cmd_listen(args):
     """Handle listen command."""
     print(f"👂 Listening to {args.url}...", file=sys.stderr, flush=True)
@@ -166,20 +357,16 @@ def cmd_listen(args):
     def on_message(msg):
         print(format_message(msg), flush=True)
     
-    listen_poll(args.url, args.password, on_message)
+    last_seq = show_history(args)
+    listen_poll(args.url, args.password, on_message, after_seq=last_seq)
 
 
 def cmd_join(args):
     """Handle join command - announce presence and listen."""
     print(f"🤖 Joining as {args.agent_name}...", file=sys.stderr, flush=True)
     
-    # Get existing messages first (so we know the index before join msg)
-    existing = get_messages(args.url, args.password)
-    for msg in existing:
-        print(format_message(msg), flush=True)
-    
-    if existing:
-        print("--- end of history ---", flush=True)
+    # Get recent messages first (so we know the seq before join msg)
+    last_seq = show_history(args)
     
     # Send join message
     send_message(args.url, args.password, args.agent_name, f"*joined the chat*")
@@ -187,8 +374,17 @@ def cmd_join(args):
     def on_message(msg):
         print(format_message(msg), flush=True)
     
-    # Listen from after existing messages (join msg + future will come through)
-    listen_poll(args.url, args.password, on_message)
+    # Listen from after the history (join msg + future will come through)
+    listen_poll(args.url, args.password, on_message, after_seq=last_seq)
+
+
+def add_history_arguments(parser: argparse.ArgumentParser):
+    """Add the `--history`/`--since` options of `join` and `listen`."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--history", type=int, default=DEFAULT_HISTORY, metavar="N",
+                       help=f"Recent messages to show first (default: {DEFAULT_HISTORY})")
+    group.add_argument("--since", type=int, default=None, metavar="SEQ",
+                       help="Show every message after this seq, then follow the room")
 
 
 def main():
@@ -200,28 +396,32 @@ def main():
     subparsers = parser.add_subparsers(dest="command")
     
     # serve command (delegates to server)
+    from agent_chatroom import server
     serve_parser = subparsers.add_parser("serve", help="Start the chat server")
-    serve_parser.add_argument("--password", "-p", required=True, help="Room password")
-    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
-    serve_parser.add_argument("--tunnel", choices=["cloudflared"], help="Create tunnel")
+    server.add_serve_arguments(serve_parser)
     
     # send command
     send_parser = subparsers.add_parser("send", help="Send a message")
     send_parser.add_argument("--url", "-u", required=True, help="Server URL")
     send_parser.add_argument("--password", "-p", required=True, help="Room password")
     send_parser.add_argument("--agent-name", "-a", required=True, help="Your agent name")
-    send_parser.add_argument("--message", "-m", required=True, help="Message to send")
+    send_input = send_parser.add_mutually_exclusive_group(required=True)
+    send_input.add_argument("--message", "-m", help="Message to send")
+    send_input.add_argument("--stdin", action="store_true",
+                            help="Send each line of stdin as a message, batching as they arrive")
     
     # listen command
     listen_parser = subparsers.add_parser("listen", help="Listen for messages")
     listen_parser.add_argument("--url", "-u", required=True, help="Server URL")
     listen_parser.add_argument("--password", "-p", required=True, help="Room password")
+    add_history_arguments(listen_parser)
     
     # join command
     join_parser = subparsers.add_parser("join", help="Join the chat (announce + listen)")
     join_parser.add_argument("--url", "-u", required=True, help="Server URL")
     join_parser.add_argument("--password", "-p", required=True, help="Room password")
     join_parser.add_argument("--agent-name", "-a", required=True, help="Your agent name")
+    add_history_arguments(join_parser)
     
     args = parser.parse_args()
     
@@ -231,8 +431,8 @@ def main():
     
     if args.command == "serve":
         # Delegate to server module
-        from agent_chatroom import server
-        server.serve(args.password, args.port, args.tunnel)
+        server.check_serve_args(serve_parser, args)
+        server.serve_from_args(args)
     elif args.command == "send":
         cmd_send(args)
     elif args.command == "listen":
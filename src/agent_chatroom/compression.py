@@ -0,0 +1,104 @@
+"""HTTP content codings: negotiating, applying and undoing gzip and deflate."""
+
+import zlib
+from typing import Callable, Iterable, Iterator, Optional
+
+# Codings the server can produce, most preferred first
+ENCODINGS = ('gzip', 'deflate')
+# Bodies smaller than this gain too little to be worth compressing
+MIN_SIZE = 1024
+# zlib level: chat text compresses well long before the slow levels
+LEVEL = 6
+# A long-lived stream keeps its compressor for as long as it is open. An
+# 8 KB window and a small hash table (about 50 KB in all, against 256 KB
+# for zlib's defaults) still span dozens of recent events.
+STREAM_WINDOW_BITS = 13
+STREAM_MEM_LEVEL = 5
+
+
+def _wbits(encoding: str, window_bits: int = zlib.MAX_WBITS) -> int:
+    # gzip wraps deflate in a gzip header; HTTP's "deflate" is the zlib format
+    return 16 + window_bits if encoding == 'gzip' else window_bits
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick a coding for an Accept-Encoding header, or None to send the body as is."""
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, *params = item.split(';')
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compressor(encoding: str):
+    """A zlib compression object producing ``encoding``."""
+    return zlib.compressobj(LEVEL, zlib.DEFLATED, _wbits(encoding))
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a whole body with ``encoding``."""
+    stream = compressor(encoding)
+    return stream.compress(body) + stream.flush()
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress a body that is produced in pieces, yielding compressed pieces."""
+    stream = compressor(encoding)
+    for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+
+def stream_encoder(encoding: Optional[str]) -> Callable[[bytes], bytes]:
+    """Return a function that encodes the successive writes of a stream.
+
+    Each write is sync-flushed, so the client can decode every event as
+    soon as it arrives, while the dictionary carries over between events
+    and keeps compressing their repeated keys. With no ``encoding`` the
+    writes pass through unchanged.
+    """
+    if encoding is None:
+        return bytes
+    stream = zlib.compressobj(LEVEL, zlib.DEFLATED, _wbits(encoding, STREAM_WINDOW_BITS),
+                              STREAM_MEM_LEVEL)
+
+    def encode(data: bytes) -> bytes:
+        return stream.compress(data) + stream.flush(zlib.Z_SYNC_FLUSH)
+    return encode
+
+
+def decompressor(encoding: str):
+    """A zlib decompression object undoing ``encoding``."""
+    return zlib.decompressobj(_wbits(encoding))
+
+
+def decompress(body: bytes, encoding: Optional[str]) -> bytes:
+    """Undo a response's Content-Encoding; other codings pass through unchanged."""
+    if encoding not in ENCODINGS:
+        return body
+    stream = decompressor(encoding)
+    return stream.decompress(body) + stream.flush()
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """The ETag of a representation compressed with ``encoding``.
+
+    Compressed bytes differ from the originals, so a strong ETag has to
+    differ too; the coding is added as a suffix inside the quotes.
+    """
+    return f'{etag[:-1]}-{encoding}"'
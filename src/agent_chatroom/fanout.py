@@ -0,0 +1,260 @@
+"""Fan-out of new messages to streaming subscribers through a shared log."""
+
+import bisect
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from agent_chatroom.store import StoredMessage
+
+
+def sse_frame(entry: StoredMessage) -> bytes:
+    """Build the SSE frame for a stored message, using its seq as the event id."""
+    return b'id: %d\ndata: ' % entry.seq + entry.data + b'\n\n'
+
+
+OVERFLOW_POLICIES = ('catch-up', 'drop-oldest', 'disconnect')
+
+
+@dataclass
+class SubscriberLimits:
+    """How far a subscriber may fall behind, and what happens when it does.
+
+    A subscriber's backlog is everything published past its cursor. Once it
+    exceeds ``max_messages`` or ``max_bytes`` (or falls out of the log),
+    ``on_overflow`` decides: ``catch-up`` switches it to reading from the
+    store, ``drop-oldest`` skips ahead and keeps only the newest messages
+    within the limits, and ``disconnect`` closes it. ``write_timeout`` bounds
+    how long a write to a stalled connection may block.
+
+    A stream that wrote less than ``coalesce_window`` seconds ago gathers
+    what is published next until the window has passed, or until it holds
+    ``coalesce_bytes``, and sends it in one write. A stream that has been
+    quiet for the window writes each message at once.
+    """
+
+    max_messages: Optional[int] = 1000
+    max_bytes: Optional[int] = None
+    on_overflow: str = 'catch-up'
+    write_timeout: float = 60.0
+    coalesce_window: float = 0.005
+    coalesce_bytes: int = 64 * 1024
+
+    def __post_init__(self):
+        if self.on_overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"on_overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        if self.coalesce_window < 0 or self.coalesce_bytes < 1:
+            raise ValueError("coalesce_window must not be negative and coalesce_bytes must be positive")
+
+
+class Lagged(Exception):
+    """The subscriber must catch up from the store before reading the log."""
+
+
+class SlowConsumer(Exception):
+    """The subscriber fell too far behind and should be disconnected."""
+
+
+class Closed(SlowConsumer):
+    """The fan-out was closed (its room is gone); disconnect the subscriber."""
+
+
+class FanOut:
+    """Publishes message batches to any number of subscribers.
+
+    Publishers hand batches to a dispatcher thread, which encodes each
+    message's SSE frame once, appends it to a shared log and wakes waiting
+    subscribers. Subscribers keep only a cursor into the log, so publishing
+    costs the same however many of them there are. The log keeps roughly
+    the last ``max_events`` frames; what happens to a subscriber that falls
+    behind is set by ``limits``.
+    """
+
+    def __init__(self, max_events: int = 4096, limits: Optional[SubscriberLimits] = None):
+        self.limits = limits or SubscriberLimits()
+        self.max_events = max(max_events, self.limits.max_messages or 0)
+        self._seqs: list[int] = []
+        self._frames: list[bytes] = []
+        self._ends: list[int] = []  # cumulative bytes through each frame
+        self._total_bytes = 0
+        self._trimmed_seq = 0  # newest seq dropped from the log
+        self._trimmed_bytes = 0  # cumulative bytes through that seq
+        self.last_seq = 0
+        self.closed = False
+        self.subscribers = 0
+        self.dropped_messages = 0
+        self.subscribers_dropped = 0
+        self.subscribers_disconnected = 0
+        self.catch_ups = 0
+        self._cond = threading.Condition()
+        self._inbox: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._listeners: list[Callable[[], None]] = []
+
+    def add_listener(self, callback: Callable[[], None]):
+        """Call ``callback`` from the dispatcher after every publish.
+
+        For consumers that wait on something other than :meth:`wait`, such
+        as an event loop's selector.
+        """
+        self._listeners.append(callback)
+
+    def publish(self, entries: list[StoredMessage]):
+        """Queue a batch of stored messages for dispatch."""
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None and not self.closed:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        self._inbox.put(entries)
+
+    def _run(self):
+        while True:
+            entries = self._inbox.get()
+            if entries is None:
+                # Closed; nobody is left to read the log
+                return
+            frames = [sse_frame(entry) for entry in entries]
+            with self._cond:
+                for entry, frame in zip(entries, frames):
+                    if entry.seq <= self.last_seq:
+                        continue
+                    self._total_bytes += len(frame)
+                    self._seqs.append(entry.seq)
+                    self._frames.append(frame)
+                    self._ends.append(self._total_bytes)
+                    self.last_seq = entry.seq
+                # Trim in chunks so the copy is amortized over many publishes
+                if len(self._seqs) > 2 * self.max_events:
+                    cut = len(self._seqs) - self.max_events
+                    self._trimmed_seq = self._seqs[cut - 1]
+                    self._trimmed_bytes = self._ends[cut - 1]
+                    del self._seqs[:cut]
+                    del self._frames[:cut]
+                    del self._ends[:cut]
+                self._cond.notify_all()
+            for callback in self._listeners:
+                callback()
+
+    def close(self):
+        """Wake every waiter and stop the dispatcher thread.
+
+        Subscribers' next reads raise :class:`Closed`.
+        """
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        with self._thread_lock:
+            # No dispatcher starts once closed; a running one exits when it
+            # reaches this marker
+            if self._thread is not None:
+                self._inbox.put(None)
+        for callback in self._listeners:
+            callback()
+
+    def wait(self, after_seq: int, timeout: float) -> bool:
+        """Block until a message past ``after_seq`` has been published."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.last_seq > after_seq or self.closed, timeout)
+
+    def subscribe(self, after_seq: int) -> 'Subscription':
+        """Subscribe from ``after_seq``.
+
+        To start from now, pass the store's newest seq: the log only knows
+        what has been published since it was created, so after a journal
+        replay its own ``last_seq`` is behind the room's.
+        """
+        with self._cond:
+            self.subscribers += 1
+            return Subscription(self, after_seq)
+
+    def _offset(self, index: int) -> int:
+        """Cumulative bytes before the frame at ``index``. Caller holds the lock."""
+        return self._ends[index - 1] if index > 0 else self._trimmed_bytes
+
+    def _read(self, sub: 'Subscription', timeout: float) -> list[tuple[int, bytes]]:
+        cursor = sub.cursor
+        limits = self.limits
+        with self._cond:
+            if self.last_seq <= cursor:
+                self._cond.wait_for(lambda: self.last_seq > cursor or self.closed, timeout)
+            if self.closed:
+                raise Closed()
+            start = bisect.bisect_right(self._seqs, cursor)
+            end = len(self._seqs)
+            over = (
+                cursor < self._trimmed_seq
+                or (limits.max_messages is not None and end - start > limits.max_messages)
+                or (limits.max_bytes is not None
+                    and self._total_bytes - self._offset(start) > limits.max_bytes)
+            )
+            if over:
+                if limits.on_overflow == 'disconnect':
+                    self.subscribers_disconnected += 1
+                    raise SlowConsumer()
+                if limits.on_overflow == 'catch-up':
+                    self.catch_ups += 1
+                    raise Lagged()
+                # drop-oldest: keep only the newest backlog within the limits
+                if limits.max_messages is not None:
+                    start = max(start, end - limits.max_messages)
+                if (limits.max_bytes is not None
+                        and self._total_bytes - self._offset(start) > limits.max_bytes):
+                    floor = self._total_bytes - limits.max_bytes
+                    start = bisect.bisect_left(self._ends, floor) + 1
+                kept_from = self._seqs[start] if start < end else self.last_seq + 1
+                self.dropped_messages += kept_from - cursor - 1
+                sub.cursor = kept_from - 1
+                if not sub.dropped:
+                    sub.dropped = True
+                    self.subscribers_dropped += 1
+            return list(zip(self._seqs[start:], self._frames[start:]))
+
+    def _unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def stats(self) -> dict:
+        """Return subscriber and log counters."""
+        with self._cond:
+            return {
+                'subscribers': self.subscribers,
+                'log_events': len(self._seqs),
+                'last_seq': self.last_seq,
+                'on_overflow': self.limits.on_overflow,
+                'dropped_messages': self.dropped_messages,
+                'subscribers_dropped': self.subscribers_dropped,
+                'subscribers_disconnected': self.subscribers_disconnected,
+                'catch_ups': self.catch_ups,
+            }
+
+
+class Subscription:
+    """A subscriber's position in a :class:`FanOut` log."""
+
+    def __init__(self, fanout: FanOut, cursor: int):
+        self.fanout = fanout
+        self.cursor = cursor
+        self.dropped = False
+        self._closed = False
+
+    def read(self, timeout: float) -> list[tuple[int, bytes]]:
+        """Return `(seq, frame)` pairs past the cursor, waiting up to ``timeout``.
+
+        Returns an empty list on timeout. If the subscriber is over its
+        limits this raises :class:`Lagged` (catch up from the store) or
+        :class:`SlowConsumer` (disconnect), or silently skips the oldest
+        messages, depending on the policy. The cursor advances past whatever
+        is returned.
+        """
+        events = self.fanout._read(self, timeout)
+        if events:
+            self.cursor = events[-1][0]
+        return events
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.fanout._unsubscribe()
@@ -0,0 +1,213 @@
+"""Group-commit pipeline for incoming messages."""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Hashable, Optional
+
+
+class _Pending:
+    """Items from one submission, waiting for their batch to commit."""
+
+    __slots__ = ('items', 'done', 'callback', 'result', 'error')
+
+    def __init__(self, items: list, callback: Optional[Callable] = None):
+        self.items = items
+        self.done = threading.Event()
+        self.callback = callback
+        self.result: list = []
+        self.error: Optional[BaseException] = None
+
+    def finish(self):
+        if self.callback is not None:
+            self.callback(self.result, self.error)
+        self.done.set()
+
+
+class PipelineClosed(Exception):
+    """The pipeline was closed before the items could be queued."""
+
+
+class IngestPipeline:
+    """Commits submitted items in batches from a single thread.
+
+    Items that arrive within ``window`` seconds of the first one in a batch
+    (up to ``max_batch``) are handed to ``commit`` together, so the
+    per-batch costs — locks, journal writes, fan-out, console output — are
+    paid once. ``commit`` returns one result per item, in order. Submitters
+    either block until their batch has committed or get a callback. The
+    items of one :meth:`submit_many` call are never split across batches
+    or interleaved with other submissions.
+
+    Submissions are queued by ``key(item)`` of their first item (one queue
+    if ``key`` is None) and batches are filled from those queues by
+    deficit round robin: each turn a queue may take ``weights[key]``
+    (default 1) items more, so a key with a backlog cannot hold back a
+    quiet one. A lone submission waits for at most one turn of every other
+    busy key, whatever their backlog.
+
+    :meth:`close` commits what is queued and ends the thread; later
+    submissions fail with :class:`PipelineClosed`.
+    """
+
+    def __init__(self, commit: Callable[[list], list], window: float = 0.002,
+                 max_batch: int = 256, key: Optional[Callable[[Any], Hashable]] = None,
+                 weights: Optional[dict] = None):
+        self.commit = commit
+        self.window = window
+        self.max_batch = max_batch
+        self.key = key
+        self.weights = weights or {}
+        if any(weight < 1 for weight in self.weights.values()):
+            raise ValueError("weights must be positive")
+        self._queues: dict[Hashable, deque] = {}
+        self._deficits: dict[Hashable, int] = {}
+        self._active: deque = deque()  # keys with queued submissions, in turn order
+        self._in_turn = False  # the front key already got its quantum
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item: Any) -> Any:
+        """Queue ``item`` and return its result once its batch commits."""
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items: list) -> list:
+        """Queue ``items`` to commit together and return their results."""
+        pending = self._enqueue(_Pending(items))
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def submit_nowait(self, item: Any, callback: Callable[[Any, Optional[BaseException]], None]):
+        """Queue ``item`` without waiting for it to commit.
+
+        ``callback(result, error)`` is called from the ingest thread once the
+        batch has committed.
+        """
+        self.submit_many_nowait(
+            [item], lambda results, error: callback(results[0] if results else None, error))
+
+    def submit_many_nowait(self, items: list,
+                           callback: Callable[[list, Optional[BaseException]], None]):
+        """Queue ``items`` to commit together; ``callback(results, error)`` follows."""
+        self._enqueue(_Pending(items, callback))
+
+    def _enqueue(self, pending: _Pending) -> _Pending:
+        key = self.key(pending.items[0]) if self.key else None
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+                queue = self._queues.get(key)
+                if queue is None:
+                    queue = self._queues[key] = deque()
+                    self._deficits[key] = 0
+                    self._active.append(key)
+                queue.append(pending)
+                self._queued += len(pending.items)
+                self._cond.notify()
+        if closed:
+            # Outside the lock: the callback may submit again
+            pending.error = PipelineClosed()
+            pending.finish()
+        return pending
+
+    def _next_batch(self) -> Optional[list[_Pending]]:
+        """Wait for the next batch; None once closed with nothing left queued."""
+        with self._cond:
+            while not self._active:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            deadline = time.monotonic() + self.window
+            while self._queued < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._take()
+
+    def _take(self) -> list[_Pending]:
+        """Fill a batch from the per-key queues by deficit round robin.
+
+        Whole submissions only; a single one larger than max_batch still
+        goes through on its own. A turn cut short by a full batch carries
+        on at the start of the next one.
+        """
+        batch: list[_Pending] = []
+        count = 0
+        while self._active:
+            key = self._active[0]
+            queue = self._queues[key]
+            if not self._in_turn:
+                self._deficits[key] += self.weights.get(key, 1)
+                self._in_turn = True
+            while queue:
+                size = len(queue[0].items)
+                if size > self._deficits[key]:
+                    break
+                if batch and count + size > self.max_batch:
+                    self._queued -= count
+                    return batch
+                batch.append(queue.popleft())
+                count += size
+                self._deficits[key] -= size
+            self._in_turn = False
+            if queue:
+                self._active.rotate(-1)
+            else:
+                # An idle key keeps no credit for later
+                self._active.popleft()
+                del self._queues[key], self._deficits[key]
+        self._queued -= count
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            items = [item for pending in batch for item in pending.items]
+            try:
+                results = self.commit(items)
+                start = 0
+                for pending in batch:
+                    pending.result = results[start:start + len(pending.items)]
+                    start += len(pending.items)
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            self.batches += 1
+            self.items += len(items)
+            for pending in batch:
+                pending.finish()
+
+    def close(self):
+        """Commit whatever is queued, then stop the ingest thread.
+
+        The thread holds ``commit`` (and whatever it is bound to), so a
+        pipeline that is no longer used must be closed to be freed.
+        """
+        with self._cond:
+            self._closed = True
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def stats(self) -> dict:
+        """Return batch and queue counters."""
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'queued': self._queued,
+            'queues': len(self._active),
+            'window_ms': self.window * 1000,
+        }
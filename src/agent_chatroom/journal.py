@@ -0,0 +1,170 @@
+"""Append-only JSONL journal so a room's history survives restarts."""
+
+import collections
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+from agent_chatroom.pages import new_epoch
+from agent_chatroom.store import MessageStore, StoredMessage
+
+FSYNC_MODES = ('always', 'batch', 'never')
+
+# Rewrite the journal on load once it holds this many times more lines than
+# the store can retain.
+COMPACT_RATIO = 2
+
+
+def _line_seq(line: bytes) -> Optional[int]:
+    """Return the seq of a journal line, or None if the line is damaged."""
+    # Lines are stored message bytes, which always start with the seq
+    if not line.startswith(b'{"seq": ') or not line.endswith(b'}\n'):
+        return None
+    try:
+        return int(line[8:line.index(b',', 8)])
+    except ValueError:
+        return None
+
+
+def _entry_from_line(seq: int, line: bytes) -> StoredMessage:
+    """Rebuild a store entry, dating it by the message timestamp."""
+    data = line.rstrip(b'\n')
+    try:
+        ts = json.loads(data).get('timestamp', '')
+        stored_at = datetime.fromisoformat(ts).timestamp()
+    except (ValueError, TypeError, AttributeError):
+        stored_at = 0.0
+    return StoredMessage(seq, data, stored_at)
+
+
+def load_journal(path: str, store: MessageStore, keep: Optional[int] = None) -> int:
+    """Replay a journal into ``store`` and return how many messages it loaded.
+
+    Only the last ``keep`` lines are decoded, since the store would evict
+    anything older anyway. A torn final line from a crash is cut off, and a
+    journal that has grown well past ``keep`` is compacted in place.
+    """
+    if not os.path.exists(path):
+        return 0
+
+    tail: collections.deque = collections.deque(maxlen=keep)
+    total = 0
+    good_end = 0
+    last_seq = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            seq = _line_seq(line)
+            if seq is None or seq <= last_seq:
+                if not line.endswith(b'\n'):
+                    break  # torn write at the end of the file
+                continue
+            tail.append((seq, line))
+            last_seq = seq
+            total += 1
+            good_end = f.tell()
+        size = f.seek(0, os.SEEK_END)
+
+    if size > good_end:
+        with open(path, 'r+b') as f:
+            f.truncate(good_end)
+
+    for seq, line in tail:
+        store.insert(_entry_from_line(seq, line))
+
+    if keep is not None and total > keep * COMPACT_RATIO:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.writelines(line for _, line in tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    return len(tail)
+
+
+def journal_epoch(path: str) -> str:
+    """Return the epoch of the seqs in the journal at ``path``.
+
+    It is kept in ``<path>.epoch`` so history page URLs outlive restarts.
+    A missing or empty journal starts its seqs over, so it gets a new one.
+    """
+    epoch_path = path + '.epoch'
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        try:
+            with open(epoch_path) as f:
+                epoch = f.read().strip()
+            if epoch:
+                return epoch
+        except OSError:
+            pass
+    epoch = new_epoch()
+    tmp_path = epoch_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(epoch + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, epoch_path)
+    return epoch
+
+
+class Journal:
+    """Write-ahead journal of stored messages, one JSON object per line.
+
+    Every append reaches the OS before returning. ``fsync`` controls when it
+    reaches the disk: on every append (``always``), from a background thread
+    every ``fsync_interval`` seconds (``batch``), or whenever the OS decides
+    (``never``).
+    """
+
+    def __init__(self, path: str, fsync: str = 'batch', fsync_interval: float = 0.05):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_MODES)}")
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._closed = threading.Event()
+        if fsync == 'batch':
+            threading.Thread(target=self._sync_loop, daemon=True).start()
+
+    def append(self, entries: list[StoredMessage]):
+        """Append entries in seq order."""
+        data = b''.join(entry.data + b'\n' for entry in entries)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync == 'always':
+                os.fsync(self._file.fileno())
+            else:
+                self._dirty = True
+
+    def sync(self):
+        """Flush anything written since the last sync to disk."""
+        with self._lock:
+            if not self._dirty or self._file.closed:
+                return
+            self._dirty = False
+            fd = self._file.fileno()
+        # Appends keep going while the disk catches up
+        os.fsync(fd)
+
+    def _sync_loop(self):
+        while not self._closed.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except OSError:
+                pass
+
+    def close(self):
+        """Sync and close the journal."""
+        self._closed.set()
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
@@ -0,0 +1,299 @@
+"""Event-loop thread that serves idle SSE streams and long-polls."""
+
+import heapq
+import itertools
+import queue
+import selectors
+import socket
+import threading
+import time
+from typing import Callable, Optional
+
+from agent_chatroom.fanout import FanOut, Lagged, SlowConsumer, Subscription
+
+KEEPALIVE_INTERVAL = 15.0
+
+# Stop pulling from a stream's subscription while this much is still unsent;
+# the backlog then builds up in the shared log, where the slow-consumer
+# policy applies to it.
+MAX_PENDING_BYTES = 256 * 1024
+
+
+class _Stream:
+    """A handed-off SSE connection."""
+
+    __slots__ = ('sock', 'out', 'last_write', 'writing', 'on_close', 'sub', 'catch_up', 'encode',
+                 'pending', 'held', 'released')
+
+    def __init__(self, sock: socket.socket, sub: Subscription,
+                 catch_up: Callable[[Subscription], bytes],
+                 on_close: Optional[Callable[[], None]] = None,
+                 encode: Callable[[bytes], bytes] = bytes):
+        self.sock = sock
+        self.out = bytearray()
+        self.last_write = time.monotonic()
+        self.writing = False  # registered for EVENT_WRITE
+        self.on_close = on_close
+        self.sub = sub
+        self.catch_up = catch_up
+        self.encode = encode
+        self.pending = bytearray()  # frames held back to coalesce with what follows
+        self.held = False  # a release of ``pending`` is scheduled
+        self.released = 0.0  # when frames were last moved to ``out``
+
+
+class _Poll:
+    """A handed-off long-poll waiting for messages past ``after_seq``."""
+
+    __slots__ = ('sock', 'out', 'last_write', 'writing', 'on_close', 'fanout', 'after_seq',
+                 'deadline', 'respond', 'responded')
+
+    def __init__(self, sock: socket.socket, fanout: FanOut, after_seq: int, deadline: float,
+                 respond: Callable[[], bytes], on_close: Optional[Callable[[], None]] = None):
+        self.sock = sock
+        self.out = bytearray()
+        self.last_write = time.monotonic()
+        self.writing = False  # registered for EVENT_WRITE
+        self.on_close = on_close
+        self.fanout = fanout
+        self.after_seq = after_seq
+        self.deadline = deadline
+        self.respond = respond
+        self.responded = False
+
+
+class StreamMultiplexer:
+    """Serves SSE streams and long-polls for any number of connections.
+
+    Request handlers parse the request and send the headers, then hand the
+    socket over with :meth:`add_stream` or :meth:`add_poll` and return,
+    freeing their thread. One thread then waits on all the sockets with a
+    selector: it writes new frames when the fan-out publishes, sends
+    keepalives, answers long-polls when messages arrive or they time out,
+    and closes connections whose peer has gone. It must be told about
+    publishes through :meth:`notify`, e.g. as a fan-out listener.
+
+    Frames for a stream that wrote within the last ``coalesce_window``
+    seconds are held until the window has passed, or ``coalesce_bytes``
+    have built up, and then sent in one write.
+    """
+
+    def __init__(self, write_timeout: float = 60.0, coalesce_window: float = 0.005,
+                 coalesce_bytes: int = 64 * 1024):
+        self.write_timeout = write_timeout
+        self.coalesce_window = coalesce_window
+        self.coalesce_bytes = coalesce_bytes
+        self._selector = selectors.DefaultSelector()
+        self._conns: dict[socket.socket, object] = {}
+        self._deadlines: list = []  # heap of (deadline, tiebreak, poll or held stream)
+        self._tiebreak = itertools.count()
+        self._incoming: queue.SimpleQueue = queue.SimpleQueue()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._published = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self.streams = 0
+        self.polls = 0
+
+    def add_stream(self, sock: socket.socket, sub: Subscription,
+                   catch_up: Callable[[Subscription], bytes],
+                   on_close: Optional[Callable[[], None]] = None,
+                   encode: Callable[[bytes], bytes] = bytes):
+        """Take over an SSE connection whose headers have been sent.
+
+        ``on_close`` is called once the connection has been closed.
+        Everything written passes through ``encode``, which carries on
+        any content coding the handler started.
+        """
+        self._add(_Stream(sock, sub, catch_up, on_close, encode))
+
+    def add_poll(self, sock: socket.socket, fanout: FanOut, after_seq: int, timeout: float,
+                 respond: Callable[[], bytes], on_close: Optional[Callable[[], None]] = None):
+        """Take over a long-poll waiting on ``fanout``.
+
+        ``respond`` builds the complete HTTP response.
+        """
+        self._add(_Poll(sock, fanout, after_seq, time.monotonic() + timeout, respond, on_close))
+
+    def _add(self, conn):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        self._incoming.put(conn)
+        self._wake()
+
+    def notify(self):
+        """Check every connection for new messages; call after any publish."""
+        self._published.set()
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # already has a pending wakeup
+
+    def stats(self) -> dict:
+        """Return connection counts."""
+        return {'streams': self.streams, 'polls': self.polls}
+
+    def _run(self):
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        last_sweep = time.monotonic()
+        while True:
+            timeout = 1.0
+            if self._deadlines:
+                timeout = max(0.0, min(timeout, self._deadlines[0][0] - time.monotonic()))
+            for key, mask in self._selector.select(timeout):
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                conn = key.data
+                if mask & selectors.EVENT_READ:
+                    self._on_readable(conn)
+                if mask & selectors.EVENT_WRITE and conn.sock in self._conns:
+                    if self._flush(conn) and isinstance(conn, _Stream):
+                        # Room freed up; pull anything that was held back
+                        self._pump(conn)
+
+            while True:
+                try:
+                    conn = self._incoming.get_nowait()
+                except queue.Empty:
+                    break
+                conn.sock.setblocking(False)
+                self._conns[conn.sock] = conn
+                if isinstance(conn, _Stream):
+                    self.streams += 1
+                else:
+                    self.polls += 1
+                    heapq.heappush(self._deadlines, (conn.deadline, next(self._tiebreak), conn))
+                self._selector.register(conn.sock, selectors.EVENT_READ, conn)
+                self._pump(conn)
+
+            if self._published.is_set():
+                self._published.clear()
+                for conn in list(self._conns.values()):
+                    self._pump(conn)
+
+            now = time.monotonic()
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, _, conn = heapq.heappop(self._deadlines)
+                if conn.sock not in self._conns:
+                    continue
+                if isinstance(conn, _Stream):
+                    conn.held = False
+                    self._release(conn)
+                elif not conn.responded:
+                    self._respond(conn)
+            if now - last_sweep >= 1.0:
+                last_sweep = now
+                self._sweep(now)
+
+    def _pump(self, conn):
+        """Move whatever is ready for ``conn`` into its buffer and send it."""
+        if isinstance(conn, _Stream):
+            if len(conn.out) + len(conn.pending) < MAX_PENDING_BYTES:
+                try:
+                    conn.pending += b''.join(frame for _, frame in conn.sub.read(timeout=0))
+                except Lagged:
+                    conn.pending += conn.catch_up(conn.sub)
+                except SlowConsumer:
+                    self._close(conn)
+                    return
+            release_at = conn.released + self.coalesce_window
+            if (conn.pending and not conn.held and len(conn.pending) < self.coalesce_bytes
+                    and time.monotonic() < release_at):
+                # Wrote just now; hold these for whatever follows
+                conn.held = True
+                heapq.heappush(self._deadlines, (release_at, next(self._tiebreak), conn))
+            if not conn.held or len(conn.pending) >= self.coalesce_bytes:
+                self._release(conn)
+                return
+        elif not conn.responded and (conn.fanout.last_seq > conn.after_seq or conn.fanout.closed):
+            self._respond(conn)
+        if conn.out:
+            self._flush(conn)
+
+    def _release(self, conn: _Stream):
+        """Encode a stream's held frames into its output buffer and send."""
+        if conn.pending:
+            conn.out += conn.encode(bytes(conn.pending))
+            conn.pending.clear()
+            conn.released = time.monotonic()
+        if conn.out:
+            self._flush(conn)
+
+    def _respond(self, conn: _Poll):
+        conn.responded = True
+        conn.out += conn.respond()
+        self._flush(conn)
+
+    def _flush(self, conn) -> bool:
+        """Send what the socket will take; returns whether the buffer emptied."""
+        try:
+            while conn.out:
+                sent = conn.sock.send(conn.out)
+                del conn.out[:sent]
+                conn.last_write = time.monotonic()
+        except BlockingIOError:
+            if not conn.writing:
+                conn.writing = True
+                self._selector.modify(conn.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, conn)
+            return False
+        except OSError:
+            self._close(conn)
+            return False
+        if isinstance(conn, _Poll) and conn.responded:
+            self._close(conn)
+            return False
+        if conn.writing:
+            conn.writing = False
+            self._selector.modify(conn.sock, selectors.EVENT_READ, conn)
+        return True
+
+    def _on_readable(self, conn):
+        # Clients send nothing more on these connections; readable means
+        # they hung up (or misbehaved)
+        try:
+            data = conn.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(conn)
+
+    def _sweep(self, now: float):
+        for conn in list(self._conns.values()):
+            if conn.out and now - conn.last_write > self.write_timeout:
+                self._close(conn)
+            elif (isinstance(conn, _Stream) and not conn.out and not conn.pending
+                  and now - conn.last_write >= KEEPALIVE_INTERVAL):
+                conn.out += conn.encode(b": keepalive\n\n")
+                self._flush(conn)
+
+    def _close(self, conn):
+        if self._conns.pop(conn.sock, None) is None:
+            return
+        self._selector.unregister(conn.sock)
+        if isinstance(conn, _Stream):
+            self.streams -= 1
+            conn.sub.close()
+        else:
+            self.polls -= 1
+        try:
+            conn.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        conn.sock.close()
+        if conn.on_close is not None:
+            conn.on_close()
@@ -0,0 +1,118 @@
+"""Fixed-size, immutable pages of a room's history."""
+
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from agent_chatroom.compression import compress
+from agent_chatroom.store import MessageStore
+
+# Seqs per page: page n holds seqs n*PAGE_SIZE+1 .. (n+1)*PAGE_SIZE
+PAGE_SIZE = 1000
+
+
+def new_epoch() -> str:
+    """A fresh, unguessable id for a room's seq numbering."""
+    return secrets.token_hex(8)
+
+
+class PageGone(Exception):
+    """Retention has already evicted messages from the page."""
+
+
+class Page:
+    """One encoded page of history.
+
+    A sealed page lies wholly at or below the room's last seq, so its
+    messages, and therefore its bytes, can never change. That goes for
+    its compressed bytes too, which are kept once made.
+    """
+
+    __slots__ = ('number', 'body', 'etag', 'sealed', 'encoded')
+
+    def __init__(self, number: int, body: bytes, etag: str, sealed: bool):
+        self.number = number
+        self.body = body
+        self.etag = etag
+        self.sealed = sealed
+        self.encoded: dict[str, bytes] = {}
+
+    def encode(self, encoding: str) -> bytes:
+        """Return the body compressed with ``encoding``, compressing it only once."""
+        body = self.encoded.get(encoding)
+        if body is None:
+            body = self.encoded[encoding] = compress(self.body, encoding)
+        return body
+
+
+class HistoryPages:
+    """Serves a store's history as pages of ``page_size`` seqs.
+
+    Sealed pages are encoded (and compressed, per coding asked for) once
+    and kept in an LRU of ``max_cached`` pages; only the open page at the tail is encoded per request. A page
+    is served only while every seq in it is still retained.
+
+    ``epoch`` names this numbering of seqs: the same seq in the same
+    epoch is always the same message. It is part of every ETag and of the
+    versioned page URLs that may be cached indefinitely.
+    """
+
+    def __init__(self, store: MessageStore, epoch: Optional[str] = None,
+                 page_size: int = PAGE_SIZE, max_cached: int = 64):
+        self.store = store
+        self.epoch = epoch or new_epoch()
+        self.page_size = page_size
+        self.max_cached = max_cached
+        self._cache: OrderedDict[int, Page] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, number: int) -> Optional[Page]:
+        """Return page ``number``, or None if it has not been started.
+
+        Raises :class:`PageGone` once retention has evicted part of it.
+        """
+        first = number * self.page_size + 1
+        end = first + self.page_size
+        if self.store.first_seq > first:
+            with self._lock:
+                self._cache.pop(number, None)
+            raise PageGone(number)
+        with self._lock:
+            page = self._cache.get(number)
+            if page is not None:
+                self._cache.move_to_end(number)
+                self.hits += 1
+                return page
+
+        last_seq = self.store.last_seq
+        if number < 0 or number > last_seq // self.page_size:
+            return None
+        entries = self.store.read(first - 1, end)
+        # Checked after the read, so a page evicted meanwhile is not served short
+        if self.store.first_seq > first:
+            raise PageGone(number)
+
+        sealed = end - 1 <= last_seq
+        body = (b'{"page": %d, "epoch": "%s", "sealed": %s, "first_seq": %d, "last_seq": %d, '
+                b'"messages": [' % (number, self.epoch.encode(), b'true' if sealed else b'false',
+                                    first, end - 1)
+                + b', '.join(entry.data for entry in entries) + b']}')
+        if not sealed:
+            # The open page changes with every post
+            return Page(number, body, f'"{self.epoch}-{number}-{last_seq}"', False)
+
+        page = Page(number, body, f'"{self.epoch}-{number}"', True)
+        with self._lock:
+            self.misses += 1
+            self._cache[number] = page
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return page
+
+    def stats(self) -> dict:
+        """Return cache counters."""
+        return {'cached': len(self._cache), 'hits': self.hits, 'misses': self.misses,
+                'page_size': self.page_size}
@@ -0,0 +1,110 @@
+"""Fixed-size worker pool and admission limits for the threaded server."""
+
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass
+class ConnectionLimits:
+    """Caps on the threaded server's threads and open connections.
+
+    ``threads`` workers serve requests; accepted connections wait in a queue
+    of up to ``backlog`` for a free worker. At most ``max_streams`` SSE
+    streams and blocking long-polls are open at once. They get workers of
+    their own, so they never take the ``threads`` meant for short requests.
+    Past either limit the server answers 503 at once, asking clients to
+    retry after ``retry_after`` seconds.
+    """
+
+    threads: int = 32
+    backlog: int = 128
+    max_streams: int = 256
+    retry_after: int = 2
+
+    def __post_init__(self):
+        if self.threads < 1 or self.backlog < 1 or self.max_streams < 0:
+            raise ValueError("threads and backlog must be positive, max_streams non-negative")
+
+
+class WorkerPool:
+    """Runs ``handle(*args)`` for queued jobs on at most ``threads`` threads.
+
+    Threads are started as jobs find no idle worker, up to the limit, and
+    then live for the life of the pool. The queue is bounded, so
+    :meth:`submit` fails rather than letting work pile up.
+    """
+
+    def __init__(self, handle: Callable, threads: int, backlog: int):
+        self.handle = handle
+        self.threads = threads
+        self._queue: queue.Queue = queue.Queue(maxsize=backlog)
+        self._lock = threading.Lock()
+        self._started = 0
+        self._idle = 0
+        self.rejected = 0
+
+    def submit(self, *args) -> bool:
+        """Queue a job; returns False if the queue is full."""
+        try:
+            self._queue.put_nowait(args)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        with self._lock:
+            if self._idle < self._queue.qsize() and self._started < self.threads:
+                self._started += 1
+                threading.Thread(target=self._run, daemon=True).start()
+        return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            args = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+            self.handle(*args)
+
+    def queued(self) -> int:
+        """How many jobs are waiting for a worker."""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """Return thread and queue counters."""
+        with self._lock:
+            return {
+                'threads': self._started,
+                'max_threads': self.threads,
+                'busy': self._started - self._idle,
+                'queued': self._queue.qsize(),
+                'rejected': self.rejected,
+            }
+
+
+class Slots:
+    """A counter of held slots that refuses rather than blocks when full."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.held = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Take a slot if one is free."""
+        with self._lock:
+            if self.held >= self.limit:
+                self.rejected += 1
+                return False
+            self.held += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.held -= 1
+
+    def stats(self) -> dict:
+        """Return slot counters."""
+        return {'held': self.held, 'limit': self.limit, 'rejected': self.rejected}
@@ -0,0 +1,135 @@
+"""Token-bucket rate limits for posting, per agent and per client address."""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+
+@dataclass
+class RateLimits:
+    """How fast agents and client addresses may post.
+
+    Each agent (per room) and each client address gets a bucket of
+    ``*_burst`` messages that refills at ``*_rate`` messages per second.
+    A rate of None disables that limit. At most ``max_keys`` buckets of
+    each kind are kept; the least recently used are forgotten first.
+    """
+
+    agent_rate: Optional[float] = None
+    agent_burst: int = 20
+    ip_rate: Optional[float] = None
+    ip_burst: int = 60
+    max_keys: int = 10000
+
+    def __post_init__(self):
+        if (self.agent_rate is not None and self.agent_rate <= 0) or (
+                self.ip_rate is not None and self.ip_rate <= 0):
+            raise ValueError("rates must be positive")
+        if self.agent_burst < 1 or self.ip_burst < 1 or self.max_keys < 1:
+            raise ValueError("bursts and max_keys must be positive")
+
+    @property
+    def enabled(self) -> bool:
+        return self.agent_rate is not None or self.ip_rate is not None
+
+
+class TokenBuckets:
+    """One token bucket per key, refilled lazily when the key is used.
+
+    Buckets live in an LRU-ordered dict capped at ``max_keys``, so a
+    :meth:`wait` or :meth:`charge` is O(1) and memory stays bounded however many keys show up. A key
+    that is forgotten starts over with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[Hashable, list] = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def _bucket(self, key: Hashable, now: float) -> list:
+        """Refill and return ``key``'s bucket. Caller holds the lock."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def wait(self, key: Hashable) -> float:
+        """Return 0 if ``key`` may post now, or the seconds until it may.
+
+        Charges nothing; a positive wait counts as a refusal.
+        """
+        with self._lock:
+            bucket = self._bucket(key, time.monotonic())
+            if bucket[0] < 1:
+                self.limited += 1
+                return (1 - bucket[0]) / self.rate
+            return 0.0
+
+    def charge(self, key: Hashable, count: int = 1):
+        """Take ``count`` tokens from ``key``'s bucket.
+
+        A batch is allowed whenever the bucket holds a token and is then
+        charged in full, leaving the bucket in debt, so batches larger
+        than ``burst`` still get through at the sustained rate.
+        """
+        with self._lock:
+            self._bucket(key, time.monotonic())[0] -= count
+
+    def stats(self) -> dict:
+        """Return the tracked key count and how many takes were refused."""
+        return {'keys': len(self._buckets), 'limited': self.limited}
+
+
+class RateLimiter:
+    """Applies :class:`RateLimits` to posts."""
+
+    def __init__(self, limits: RateLimits):
+        self.limits = limits
+        self.agents = (TokenBuckets(limits.agent_rate, limits.agent_burst, limits.max_keys)
+                       if limits.agent_rate is not None else None)
+        self.ips = (TokenBuckets(limits.ip_rate, limits.ip_burst, limits.max_keys)
+                    if limits.ip_rate is not None else None)
+
+    def check(self, room_id: str, agents: list[str], ip: str) -> int:
+        """Charge one post per entry in ``agents``, sent from ``ip``.
+
+        Every bucket is checked before any is charged, so a refused post
+        costs nothing. Returns 0 if the post may go ahead, otherwise the
+        whole seconds a client should wait (for a Retry-After header).
+        """
+        counts: dict[str, int] = {}
+        for agent in agents:
+            counts[agent] = counts.get(agent, 0) + 1
+        charges = []
+        if self.ips is not None:
+            charges.append((self.ips, ip, len(agents)))
+        if self.agents is not None:
+            charges.extend((self.agents, (room_id, agent), count)
+                           for agent, count in counts.items())
+        # A refused post is charged to no bucket
+        wait = max((buckets.wait(key) for buckets, key, _ in charges), default=0.0)
+        if not wait:
+            for buckets, key, count in charges:
+                buckets.charge(key, count)
+        return math.ceil(wait) if wait else 0
+
+    def stats(self) -> dict:
+        """Return the counters of each enabled bucket set."""
+        stats = {}
+        if self.agents is not None:
+            stats['agents'] = self.agents.stats()
+        if self.ips is not None:
+            stats['ips'] = self.ips.stats()
+        return stats
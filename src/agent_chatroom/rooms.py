@@ -0,0 +1,307 @@
+"""Chat rooms and the registry that holds them."""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+from agent_chatroom.fanout import FanOut, SubscriberLimits, Subscription
+from agent_chatroom.ingest import IngestPipeline
+from agent_chatroom.journal import Journal
+from agent_chatroom.pages import HistoryPages, new_epoch
+from agent_chatroom.store import MessageStore, RingBufferStore, StoredMessage
+
+# The room served at the top-level routes (/messages, /messages/stream, ...)
+DEFAULT_ROOM = 'default'
+
+_ROOM_ID = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]{0,63}')
+
+
+def valid_room_id(room_id: str) -> bool:
+    """Room ids are 1-64 letters, digits, `-` or `_`, starting alphanumeric."""
+    return _ROOM_ID.fullmatch(room_id) is not None
+
+
+class RoomExists(Exception):
+    """A room with that id is already registered."""
+
+
+def posting_agent(item: tuple[str, bytes, str]) -> str:
+    """The agent of an `(agent, data, log_line)` ingest item."""
+    return item[0]
+
+
+class Room:
+    """One chat room: its password, history, subscribers and ingest pipeline.
+
+    Rooms share no state and no locks, so traffic in one never waits on
+    another. Posts are queued per agent and committed round robin,
+    weighted by ``agent_weights``. ``epoch`` identifies the room's seq
+    numbering for its cacheable history pages; rooms that share a history
+    (across ``--workers``, or reloaded from a journal) must share it.
+    """
+
+    def __init__(self, room_id: str, password: str, store: Optional[MessageStore] = None,
+                 journal: Optional[Journal] = None, batch_window: float = 0.002,
+                 subscriber_limits: Optional[SubscriberLimits] = None,
+                 agent_weights: Optional[dict[str, int]] = None, epoch: Optional[str] = None):
+        self.id = room_id
+        self.password = password
+        self.store = store if store is not None else RingBufferStore()
+        self.journal = journal
+        self.fanout = FanOut(limits=subscriber_limits)
+        self.pages = HistoryPages(self.store, epoch)
+        # Concurrent POSTs are committed together by a single thread
+        self.ingest = IngestPipeline(self.commit, window=batch_window,
+                                     key=posting_agent, weights=agent_weights)
+        self.agents: set[str] = set()
+        self._agents_lock = threading.Lock()
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        """Note a request for the room, keeping it resident."""
+        self.last_active = time.monotonic()
+
+    def subscribe(self, after_seq: Optional[int] = None) -> Subscription:
+        """Subscribe to new messages past ``after_seq``, or past the newest stored one."""
+        return self.fanout.subscribe(self.store.last_seq if after_seq is None else after_seq)
+
+    def commit(self, items: list[tuple[str, bytes, str]]) -> list[StoredMessage]:
+        """Store, journal and broadcast a batch of `(agent, data, log_line)` items."""
+        entries = self.store.extend([data for _, data, _ in items])
+        if self.journal:
+            self.journal.append(entries)
+
+        # Hand off to the dispatcher; posters don't wait on the fan-out
+        self.fanout.publish(entries)
+
+        self.note_posters(items)
+        return entries
+
+    def apply(self, entries: list[StoredMessage]):
+        """Store and broadcast entries that were given seqs elsewhere."""
+        fresh = [entry for entry in entries if entry.seq > self.store.last_seq]
+        for entry in fresh:
+            self.store.insert(entry)
+        if fresh:
+            self.fanout.publish(fresh)
+
+    def note_posters(self, items: list[tuple[str, bytes, str]]):
+        """Track the agents in a committed batch and log it with one console write."""
+        with self._agents_lock:
+            self.agents.update(agent for agent, _, _ in items)
+        prefix = '' if self.id == DEFAULT_ROOM else f'#{self.id} '
+        print('\n'.join(prefix + line for _, _, line in items), flush=True)
+
+    def stats(self) -> dict:
+        """Collect the room's store, ingest and fan-out counters."""
+        return {
+            'store': self.store.stats(),
+            'ingest': self.ingest.stats(),
+            'fanout': self.fanout.stats(),
+            'pages': self.pages.stats(),
+        }
+
+    def close(self):
+        """Commit queued posts, disconnect subscribers and close the journal.
+
+        Stops the room's ingest and fan-out threads, which hold the room
+        and its store, so nothing keeps a closed room in memory.
+        """
+        self.ingest.close()
+        self.fanout.close()
+        if self.journal:
+            self.journal.close()
+
+
+class RoomRegistry:
+    """The rooms a server hosts, by id.
+
+    ``factory(room_id, password, journal_path, epoch=...)`` builds the
+    rooms made by :meth:`create`, so they get the server's retention,
+    batching and subscriber settings. Listeners added with :meth:`add_listener` are
+    attached to the fan-out of every room, including rooms created later.
+
+    With ``state_dir``, each created room keeps its password in
+    ``<id>.json`` and its history in a ``<id>.jsonl`` journal there. Such a
+    room can be dropped from memory and rebuilt from those files on its
+    next request, and it outlives restarts. Rooms that have had no
+    subscribers and no requests for ``idle_timeout`` seconds are evicted
+    that way by a background thread. The default room always stays
+    resident.
+    """
+
+    def __init__(self, factory: Callable[..., Room] = Room, state_dir: Optional[str] = None,
+                 idle_timeout: Optional[float] = None):
+        if idle_timeout is not None and state_dir is None:
+            raise ValueError("idle_timeout needs a state_dir to evict rooms to")
+        self.factory = factory
+        self.state_dir = state_dir
+        self.idle_timeout = idle_timeout
+        self._rooms: dict[str, Room] = {}
+        self._listeners: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self.evictions = 0
+        self.reloads = 0
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def add(self, room: Room) -> Room:
+        """Register a room; raises :class:`RoomExists` if the id is taken."""
+        with self._lock:
+            if room.id in self._rooms:
+                raise RoomExists(room.id)
+            for callback in self._listeners:
+                room.fanout.add_listener(callback)
+            self._rooms[room.id] = room
+            if self.idle_timeout and self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_loop, daemon=True)
+                self._sweeper.start()
+        return room
+
+    def create(self, room_id: str, password: str) -> Room:
+        """Build and register a room; raises ValueError for a malformed id.
+
+        With a state dir, the room's meta file is written to a temporary
+        name and hard-linked into place, which fails if it already exists,
+        so of two concurrent creates of one id exactly one succeeds.
+        """
+        if not valid_room_id(room_id):
+            raise ValueError('Invalid room id')
+        if room_id in self._rooms or self._on_disk(room_id):
+            raise RoomExists(room_id)
+        if not self.state_dir:
+            return self.add(self.factory(room_id, password))
+        epoch = new_epoch()
+        meta_path = self._path(room_id, '.json')
+        fd, tmp_path = tempfile.mkstemp(prefix=room_id + '.', suffix='.tmp', dir=self.state_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'id': room_id, 'password': password, 'epoch': epoch}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.link(tmp_path, meta_path)
+        except FileExistsError:
+            raise RoomExists(room_id) from None
+        finally:
+            os.unlink(tmp_path)
+        room = self.factory(room_id, password, self._path(room_id, '.jsonl'), epoch=epoch)
+        try:
+            return self.add(room)
+        except RoomExists:
+            # A request for the new room loaded it from its files first
+            room.close()
+            return self.get(room_id)
+
+    def get(self, room_id: str) -> Optional[Room]:
+        """Return a room, loading it from the state dir if it was evicted."""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is not None:
+                room.touch()
+                return room
+        if not valid_room_id(room_id) or not self._on_disk(room_id):
+            return None
+        try:
+            with open(self._path(room_id, '.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # The journal keeps its seqs, so reloaded pages are still valid
+        room = self.factory(room_id, meta['password'], self._path(room_id, '.jsonl'),
+                            epoch=meta.get('epoch'))
+        try:
+            self.add(room)
+        except RoomExists:
+            # Another request loaded it first
+            room.close()
+            return self.get(room_id)
+        self.reloads += 1
+        return room
+
+    def remove(self, room_id: str) -> bool:
+        """Unregister, close and forget a room; returns False if unknown."""
+        with self._lock:
+            room = self._rooms.pop(room_id, None)
+        if room is not None:
+            room.close()
+        found = room is not None
+        if self._on_disk(room_id):
+            found = True
+            for suffix in ('.json', '.jsonl'):
+                try:
+                    os.unlink(self._path(room_id, suffix))
+                except FileNotFoundError:
+                    pass
+        return found
+
+    def evict_idle(self) -> int:
+        """Drop rooms idle for ``idle_timeout`` from memory; returns how many."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [
+                room for room in self._rooms.values()
+                if room.id != DEFAULT_ROOM and self._on_disk(room.id)
+                and room.last_active < cutoff and room.fanout.subscribers == 0
+            ]
+            for room in idle:
+                del self._rooms[room.id]
+        # Closing syncs each journal, which is all the state it needs
+        for room in idle:
+            room.close()
+        self.evictions += len(idle)
+        return len(idle)
+
+    def _sweep_loop(self):
+        interval = min(self.idle_timeout / 4, 30.0)
+        while True:
+            time.sleep(interval)
+            self.evict_idle()
+
+    def _path(self, room_id: str, suffix: str) -> str:
+        return os.path.join(self.state_dir, room_id + suffix)
+
+    def _on_disk(self, room_id: str) -> bool:
+        return bool(self.state_dir) and os.path.exists(self._path(room_id, '.json'))
+
+    def ids(self) -> list[str]:
+        """Ids of every room, resident or evicted."""
+        ids = set(self._rooms)
+        if self.state_dir:
+            ids.update(name[:-len('.json')] for name in os.listdir(self.state_dir)
+                       if name.endswith('.json'))
+        return sorted(ids)
+
+    def add_listener(self, callback: Callable[[], None]):
+        """Call ``callback`` after every publish in any room."""
+        with self._lock:
+            self._listeners.append(callback)
+            for room in self._rooms.values():
+                room.fanout.add_listener(callback)
+
+    def resident(self, room_id: str) -> Optional[Room]:
+        """Return a room only if it is in memory, without touching it."""
+        return self._rooms.get(room_id)
+
+    def stats(self) -> dict:
+        """Return resident room count and eviction counters."""
+        return {
+            'resident': len(self._rooms),
+            'evictions': self.evictions,
+            'reloads': self.reloads,
+        }
+
+    @property
+    def default(self) -> Room:
+        return self._rooms[DEFAULT_ROOM]
+
+    def __iter__(self) -> Iterator[Room]:
+        """Iterate over the resident rooms."""
+        return iter(list(self._rooms.values()))
+
+    def __len__(self) -> int:
+        return len(self._rooms)
@@ -1,14 +1,19 @@
 """agent-chat server with REST API, SSE, and Web UI."""
 
 import argparse
+import functools
 import hashlib
 import hmac
 import json
+import math
 import os
 import platform
+import select
 import signal
+import socket
 import subprocess
 import sys
+import tempfile
 import threading
 import time
 import urllib.request
@@ -16,20 +21,95 @@ import urllib.error
 import zipfile
 from datetime import datetime, timezone
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from typing import Optional
+from typing import Callable, Iterator, Optional
 from urllib.parse import parse_qs, urlparse
 
-# In-memory message store
-messages: list[dict] = []
-messages_lock = threading.Lock()
-room_password: str = ""
-connected_agents: set[str] = set()
-agents_lock = threading.Lock()
+from agent_chatroom.bus import BusClient, Sequencer
+from agent_chatroom.compression import (
+    MIN_SIZE as COMPRESS_MIN_SIZE,
+    compress,
+    compress_chunks,
+    encoded_etag,
+    negotiate,
+    stream_encoder,
+)
+from agent_chatroom.fanout import (
+    OVERFLOW_POLICIES,
+    Lagged,
+    SubscriberLimits,
+    Subscription,
+    sse_frame,
+)
+from agent_chatroom.ingest import IngestPipeline
+from agent_chatroom.journal import FSYNC_MODES, Journal, journal_epoch, load_journal
+from agent_chatroom.mux import StreamMultiplexer
+from agent_chatroom.pages import PageGone, new_epoch
+from agent_chatroom.pool import ConnectionLimits, Slots, WorkerPool
+from agent_chatroom.ratelimit import RateLimiter, RateLimits
+from agent_chatroom.rooms import DEFAULT_ROOM, Room, RoomExists, RoomRegistry
+from agent_chatroom.store import (
+    MessageStore,
+    RetentionPolicy,
+    RingBufferStore,
+    StoredMessage,
+    encode_message,
+)
 
-# SSE clients — each client gets a queue
-import queue
-sse_clients: list = []
-sse_lock = threading.Lock()
+# Rooms by id; the default room also answers the top-level routes
+rooms = RoomRegistry()
+rooms.add(Room(DEFAULT_ROOM, ''))
+# Password for creating, listing and deleting rooms
+rooms_password: str = ""
+
+# Longest a /messages/poll request may block waiting for messages (seconds)
+MAX_POLL_WAIT = 30.0
+
+# Most messages one POST /messages/batch may carry
+MAX_BATCH_MESSAGES = 1000
+
+# History bodies larger than this are streamed with chunked transfer encoding
+CHUNKED_THRESHOLD = 256 * 1024
+# Approximate size of each chunk of a streamed body
+CHUNK_SIZE = 64 * 1024
+
+# History pages live under this route prefix, e.g. /messages/pages/3
+PAGES_PREFIX = '/messages/pages/'
+# A sealed page fetched with its room's ?epoch= can never change; shared
+# caches may only keep pages of rooms without a password
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_IMMUTABLE_PRIVATE = 'private, max-age=31536000, immutable'
+# Anything else is revalidated (If-None-Match) before reuse
+CACHE_REVALIDATE = 'private, no-cache'
+
+# Longest a threaded-engine connection may sit idle before or between
+# requests while holding a worker (seconds)
+IDLE_TIMEOUT = 5.0
+# How often an idle connection checks whether others are queued for its worker
+IDLE_POLL = 0.25
+
+# Server implementations selectable with --engine
+ENGINES = ('threaded', 'asyncio')
+
+# With --stream-mux, streams and long-polls are handed to one event-loop thread
+mux: Optional[StreamMultiplexer] = None
+# With --workers, this process's link to the parent that sequences messages
+bus: Optional[BusClient] = None
+# With --agent-rate/--ip-rate, the token buckets posts are charged to
+rate_limiter: Optional[RateLimiter] = None
+
+CORS_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type, X-Room-Password, Last-Event-ID'),
+]
+SSE_HEADERS = [
+    ('Content-Type', 'text/event-stream'),
+    ('Cache-Control', 'no-cache, no-transform'),
+    ('Connection', 'keep-alive'),
+    ('X-Accel-Buffering', 'no'),
+]
+SSE_PREAMBLE = b": connected\nretry: 2000\n\n"
+SSE_KEEPALIVE = b": keepalive\n\n"
 
 WEB_UI_HTML = '''<!DOCTYPE html>
 <html lang="en">
@@ -346,27 +426,30 @@ WEB_UI_HTML = '''<!DOCTYPE html>
         // Get password from URL
         const urlParams = new URLSearchParams(window.location.search);
         const password = urlParams.get('password') || '';
+        // The page is served at / or /rooms/<id>/; API calls go to the same room
+        const base = window.location.pathname.replace(/[/]$/, '');
+        
+        // Messages shown on load; older history isn't fetched
+        const HISTORY_TAIL = 500;
         
         // Long-poll for new messages (works through cloudflared/proxies)
-        let pollNext = 0;
+        let pollNext = 0; // seq of the last message we have
         let polling = false;
         
-        let pollInterval = 500; // ms between polls
+        let pollInterval = 0; // ms between polls; the server holds each poll open
         
         async function poll() {
             if (polling) return;
             polling = true;
             try {
-                const resp = await fetch('/messages/poll?password=' + encodeURIComponent(password) + '&after=' + pollNext);
+                const resp = await fetch(base + '/messages/poll?password=' + encodeURIComponent(password) + '&after_seq=' + pollNext + '&wait=25');
                 if (!resp.ok) { polling = false; setTimeout(poll, 3000); return; }
                 const data = await resp.json();
                 pollNext = data.next;
                 if (data.messages && data.messages.length > 0) {
                     data.messages.forEach(addMessage);
-                    pollInterval = 500; // got messages → poll fast
-                } else {
-                    pollInterval = Math.min(pollInterval + 200, 3000); // slow down when idle
                 }
+                pollInterval = 0; // re-poll right away
             } catch (e) {
                 console.error('Poll error:', e);
                 pollInterval = 3000;
@@ -422,7 +505,7 @@ WEB_UI_HTML = '''<!DOCTYPE html>
             msgInput.value = '';
             addMessage(msg);  // optimistic render
 
-            fetch('/messages?password=' + encodeURIComponent(password), {
+            fetch(base + '/messages?password=' + encodeURIComponent(password), {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ agent: userName, text: text })
@@ -436,13 +519,13 @@ WEB_UI_HTML = '''<!DOCTYPE html>
             }
         });
 
-        // Load existing messages then start long-polling
-        fetch('/messages?password=' + encodeURIComponent(password))
+        // Load recent messages then start long-polling
+        fetch(base + '/messages?password=' + encodeURIComponent(password) + '&tail=' + HISTORY_TAIL)
             .then(r => r.json())
             .then(data => {
                 if (data.messages) {
                     data.messages.forEach(addMessage);
-                    pollNext = data.messages.length;
+                    pollNext = data.next;
                 }
                 poll();
             })
@@ -466,20 +549,564 @@ def check_password(provided: str, expected: str) -> bool:
     return hmac.compare_digest(provided, expected)
 
 
-def broadcast_message(msg: dict):
-    """Send message to all SSE clients via their queues."""
-    with sse_lock:
-        for client_queue in sse_clients:
-            try:
-                client_queue.put_nowait(msg)
-            except Exception:
-                pass
+def get_seq_param(params: dict, name: str, default: Optional[int] = None) -> Optional[int]:
+    """Read a seq cursor from parsed query params."""
+    values = params.get(name)
+    if not values or values[0] == '':
+        return default
+    return int(values[0])
+
+
+def parse_cursors(params: dict) -> tuple[int, Optional[int]]:
+    """Return `(after_seq, before_seq)`; raises ValueError if malformed."""
+    # `after` is the pre-seq name; seqs start at 1 so the values match
+    after_seq = get_seq_param(params, 'after_seq', get_seq_param(params, 'after', 0))
+    before_seq = get_seq_param(params, 'before_seq')
+    return after_seq, before_seq
+
+
+def parse_page(params: dict) -> tuple[Optional[int], Optional[int]]:
+    """Return `(limit, tail)`; raises ValueError unless each is absent or positive."""
+    counts = []
+    for name in ('limit', 'tail'):
+        values = params.get(name)
+        count = int(values[0]) if values and values[0] != '' else None
+        if count is not None and count < 1:
+            raise ValueError(f'{name} must be positive')
+        counts.append(count)
+    return counts[0], counts[1]
+
+
+def parse_wait(params: dict) -> float:
+    """Return the long-poll wait in seconds, capped at MAX_POLL_WAIT.
+
+    Raises ValueError unless it is a finite, non-negative number.
+    """
+    wait = float(params.get('wait', ['0'])[0] or 0)
+    if not math.isfinite(wait) or wait < 0:
+        raise ValueError('wait must be a finite, non-negative number')
+    return min(wait, MAX_POLL_WAIT)
+
+
+def stream_cursor(params: dict, last_event_id: str) -> Optional[int]:
+    """Return the seq a stream should replay from, or None to start live.
+    
+    A reconnecting EventSource sends the last id it saw, which takes
+    precedence over the cursor it first connected with.
+    """
+    if last_event_id.strip():
+        return int(last_event_id)
+    if 'after_seq' in params or 'after' in params:
+        return parse_cursors(params)[0]
+    return None
+
+
+def stream_encoding(params: dict, accept_encoding: str) -> Optional[str]:
+    """Return the coding to compress an SSE stream with, or None.
+    
+    Streams are only compressed when asked for with ``?compress=1``, as
+    some proxies hold back compressed responses until they have more.
+    """
+    if params.get('compress', ['0'])[0] in ('', '0', 'false'):
+        return None
+    return negotiate(accept_encoding)
+
+
+def sse_headers(encoding: Optional[str]) -> list[tuple[str, str]]:
+    """Response headers for an SSE stream sent with ``encoding``."""
+    if encoding is None:
+        return SSE_HEADERS
+    return [*SSE_HEADERS, ('Content-Encoding', encoding), ('Vary', 'Accept-Encoding')]
+
+
+def request_password(header_value: str, params: dict) -> str:
+    """Return the password from the X-Room-Password header or query."""
+    return header_value or params.get('password', [''])[0]
+
+
+def new_message(body: bytes) -> tuple[str, bytes, str]:
+    """Turn a POST body into an `(agent, data, log_line)` ingest item.
+    
+    Raises ValueError with the client-facing error if the body is invalid.
+    """
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError:
+        raise ValueError('Invalid JSON')
+    return message_item(data)
+
+
+def new_messages(body: bytes) -> list[tuple[str, bytes, str]]:
+    """Turn a POST /messages/batch body into ingest items.
+    
+    The body is a JSON array of `{agent, text}` objects, or an object with
+    the array under ``messages``. Either every message is valid or
+    ValueError names the first bad one.
+    """
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError:
+        raise ValueError('Invalid JSON')
+    if isinstance(data, dict):
+        data = data.get('messages')
+    if not isinstance(data, list):
+        raise ValueError('Expected an array of messages')
+    if not data:
+        raise ValueError('No messages')
+    if len(data) > MAX_BATCH_MESSAGES:
+        raise ValueError(f'At most {MAX_BATCH_MESSAGES} messages per batch')
+    items = []
+    for i, message in enumerate(data):
+        try:
+            items.append(message_item(message))
+        except ValueError as e:
+            raise ValueError(f'Message {i}: {e}')
+    return items
+
+
+def message_item(data) -> tuple[str, bytes, str]:
+    """Validate one decoded `{agent, text}` message and build its ingest item."""
+    if not isinstance(data, dict):
+        raise ValueError('Invalid JSON')
+    
+    agent = data.get('agent', 'anonymous')
+    text = data.get('text', '')
+    # The agent keys rate limits and ingest queues, so it must be a string
+    if not isinstance(agent, str):
+        raise ValueError('Agent must be a string')
+    if not text:
+        raise ValueError('Message text required')
+    
+    msg = {
+        'agent': agent,
+        'text': text,
+        'timestamp': datetime.now(timezone.utc).isoformat()
+    }
+    # Encode here, in parallel with other posters; every read path reuses
+    # the stored bytes
+    return agent, encode_message(msg), f"[{msg['timestamp'][:19]}] {agent}: {text}"
+
+
+def posted_body(entry: StoredMessage) -> bytes:
+    """Build the response to a successful POST /messages."""
+    return b'{"ok": true, "message": ' + entry.data + b'}'
+
+
+def batch_posted_body(entries: list[StoredMessage]) -> bytes:
+    """Build the response to a successful POST /messages/batch."""
+    return b'{"ok": true, "messages": [' + b', '.join(entry.data for entry in entries) + b']}'
+
+
+def client_ip(peer: str, forwarded_for: str) -> str:
+    """The address to rate-limit a request by.
+    
+    Tunnels connect from loopback, so for those the last hop recorded in
+    X-Forwarded-For (the address the tunnel saw) is used instead.
+    """
+    if forwarded_for and peer in ('127.0.0.1', '::1'):
+        return forwarded_for.rsplit(',', 1)[-1].strip()
+    return peer
+
+
+def rate_limit_wait(limiter: Optional[RateLimiter], room: Room,
+                    items: list[tuple[str, bytes, str]], ip: str) -> int:
+    """Charge a post to its agents and address; returns seconds to wait, or 0."""
+    if limiter is None:
+        return 0
+    return limiter.check(room.id, [agent for agent, _, _ in items], ip)
+
+
+def split_room_path(path: str) -> tuple[str, str]:
+    """Split `/rooms/<id>/rest` into `(id, '/rest')`.
+    
+    Any other path belongs to the default room.
+    """
+    if path.startswith('/rooms/'):
+        room_id, _, rest = path[len('/rooms/'):].partition('/')
+        return room_id, '/' + rest
+    return DEFAULT_ROOM, path
+
+
+def stats_payload(room: Room, registry: RoomRegistry, limiter: Optional[RateLimiter] = None,
+                  multiplexer: Optional[StreamMultiplexer] = None) -> dict:
+    """Collect counters from every subsystem for /stats."""
+    stats = room.stats()
+    stats['rooms'] = registry.stats()
+    if limiter:
+        stats['rate_limits'] = limiter.stats()
+    if multiplexer:
+        stats['mux'] = multiplexer.stats()
+    return stats
+
+
+def messages_body(entries: list[StoredMessage], next_seq: Optional[int] = None) -> bytes:
+    """Build a `{"messages": [...]}` body by joining pre-encoded messages."""
+    body = b'{"messages": [' + b', '.join(entry.data for entry in entries) + b']'
+    if next_seq is not None:
+        body += b', "next": %d' % next_seq
+    return body + b'}'
+
+
+def catch_up(room: Room, sub: Subscription) -> bytes:
+    """Return SSE frames for stored messages past a subscriber's cursor.
+    
+    Moves the cursor to the store's newest seq; anything in between that
+    retention has already evicted is skipped, and a cursor from before a
+    restart that is ahead of the room is pulled back.
+    """
+    last_seq = room.store.last_seq
+    backlog = room.store.read(sub.cursor, last_seq + 1)
+    sub.cursor = last_seq
+    return b''.join(sse_frame(entry) for entry in backlog)
+
+
+def read_frames(room: Room, sub: Subscription, timeout: float) -> bytes:
+    """Read the SSE frames past a subscription's cursor, waiting up to ``timeout``."""
+    try:
+        return b''.join(frame for _, frame in sub.read(timeout=timeout))
+    except Lagged:
+        # Fell out of the shared log; resume from the store
+        return catch_up(room, sub)
+
+
+def gather_frames(room: Room, sub: Subscription, data: bytes, until: float,
+                  max_bytes: int) -> bytes:
+    """Add the frames published before ``until`` (monotonic) to ``data``.
+    
+    Stops early once ``max_bytes`` are gathered; returns at once if
+    ``until`` has already passed.
+    """
+    while len(data) < max_bytes:
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            break
+        more = read_frames(room, sub, remaining)
+        if not more:
+            break
+        data += more
+    return data
+
+
+def next_cursor(entries: list[StoredMessage], after_seq: int, before_seq: Optional[int],
+                last_seq: int) -> int:
+    """The after_seq that continues a read of ``entries`` past ``after_seq``."""
+    if entries:
+        return entries[-1].seq
+    if before_seq is None:
+        # Nothing retained past the cursor: skip whatever retention evicted,
+        # and pull back a cursor from before a restart that is ahead of the room
+        return last_seq
+    return min(after_seq, last_seq)
+
+
+def poll_body(room: Room, after_seq: int, before_seq: Optional[int],
+              limit: Optional[int] = None) -> bytes:
+    """Build a poll response: messages past the cursor and the next cursor."""
+    last_seq = room.store.last_seq
+    new_msgs = room.store.read(after_seq, before_seq, limit)
+    return messages_body(new_msgs, next_cursor(new_msgs, after_seq, before_seq, last_seq))
+
+
+def history_page(room: Room, after_seq: int, before_seq: Optional[int],
+                 limit: Optional[int] = None,
+                 tail: Optional[int] = None) -> tuple[list[StoredMessage], bytes]:
+    """Select the entries for a GET /messages response.
+    
+    Returns them with the end of the body that follows the entries. Without
+    ``limit`` or ``tail`` this is every retained message between the
+    cursors. ``limit`` pages forward from ``after_seq``; ``tail`` takes the
+    newest messages before ``before_seq`` instead. A paged response also
+    carries ``next`` (the after_seq for newer messages), ``prev`` (the
+    before_seq for older ones, null when empty) and ``last_seq``.
+    
+    The store lock is only held to copy out entry references; encoding
+    happens afterwards from this snapshot.
+    """
+    if limit is None and tail is None:
+        return room.store.read(after_seq, before_seq), b']}'
+    last_seq = room.store.last_seq
+    if tail is not None:
+        entries = room.store.tail(min(tail, limit or tail), after_seq, before_seq)
+    else:
+        entries = room.store.read(after_seq, before_seq, limit)
+    prev = b'%d' % entries[0].seq if entries else b'null'
+    return entries, b'], "next": %d, "prev": %s, "last_seq": %d, "epoch": "%s"}' % (
+        next_cursor(entries, after_seq, before_seq, last_seq), prev, last_seq,
+        room.pages.epoch.encode())
+
+
+def history_body(entries: list[StoredMessage], end: bytes) -> bytes:
+    """Join a :func:`history_page` into one body."""
+    return b'{"messages": [' + b', '.join(entry.data for entry in entries) + end
+
+
+def history_chunks(entries: list[StoredMessage], end: bytes) -> Iterator[bytes]:
+    """Yield a :func:`history_page` body in pieces of about CHUNK_SIZE."""
+    parts = [b'{"messages": [']
+    size = 0
+    for i, entry in enumerate(entries):
+        if i:
+            parts.append(b', ')
+        parts.append(entry.data)
+        size += entry.size + 2
+        if size >= CHUNK_SIZE:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+    parts.append(end)
+    yield b''.join(parts)
+
+
+def history_etag(room: Room) -> str:
+    """ETag for the responses built from a room's retained history.
+    
+    Any post or eviction changes the retained range, and with it the tag.
+    Take the tag before reading the store: a body can then only be newer
+    than its tag claims, which costs a resend but never a stale 304.
+    """
+    return f'"{room.pages.epoch}-{room.store.first_seq}-{room.store.last_seq}"'
+
+
+def matching_etag(if_none_match: str, etag: str,
+                  encoding: Optional[str] = None) -> Optional[str]:
+    """Return the If-None-Match tag that validates this response, if one does.
+    
+    ``etag`` is the uncompressed body's tag and ``encoding`` the coding
+    negotiated for the request. The uncompressed tag always matches (small
+    bodies go out as is whatever was negotiated); a compressed one only in
+    the coding that would be sent now, so a gzip tag never validates an
+    identity response. A 304 answers with the matching tag.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == '*':
+        return etag
+    accepted = {etag, encoded_etag(etag, encoding)} if encoding else {etag}
+    for tag in if_none_match.split(','):
+        tag = tag.strip().removeprefix('W/')
+        if tag in accepted:
+            return tag
+    return None
+
+
+def not_modified_headers(etag: str) -> list[tuple[str, str]]:
+    """Headers for a 304 answering with ``etag``."""
+    return [('ETag', etag), ('Cache-Control', CACHE_REVALIDATE), ('Vary', 'Accept-Encoding')]
+
+
+def coded_headers(headers: list[tuple[str, str]], encoding: Optional[str]) -> list[tuple[str, str]]:
+    """Headers for a body sent with content coding ``encoding`` (None for as is).
+    
+    Compressed bytes get their own ETag, and caches are told the body
+    depends on Accept-Encoding either way.
+    """
+    if encoding is None:
+        return [*headers, ('Vary', 'Accept-Encoding')]
+    return [*((name, encoded_etag(value, encoding) if name == 'ETag' else value)
+              for name, value in headers),
+            ('Content-Encoding', encoding), ('Vary', 'Accept-Encoding')]
+
+
+def encode_response(body: bytes, headers: list[tuple[str, str]], encoding: Optional[str],
+                    encode: Callable[[bytes, str], bytes] = compress
+                    ) -> tuple[bytes, list[tuple[str, str]]]:
+    """Compress a body with the negotiated ``encoding`` if it is worth it.
+    
+    Returns the body to send and its headers, from :func:`coded_headers`.
+    """
+    if encoding is None or len(body) < COMPRESS_MIN_SIZE:
+        return body, coded_headers(headers, None)
+    return encode(body, encoding), coded_headers(headers, encoding)
+
+
+def page_response(room: Room, route: str, params: dict, if_none_match: str = '',
+                  encoding: Optional[str] = None) -> tuple[int, bytes, list[tuple[str, str]]]:
+    """Handle GET /messages/pages/<n>; returns the status, body and extra headers.
+    
+    Requested with ``?epoch=`` matching the room's, a sealed page is
+    served as cacheable forever, by shared caches too only if the room
+    has no password. A stale epoch means the room's seqs were renumbered
+    (a restart without a journal) and gets 410, as does a page retention
+    has cut into.
+    
+    With a negotiated ``encoding`` the page goes out compressed, from
+    bytes the page keeps, so a popular page is only compressed once.
+    """
+    number = route[len(PAGES_PREFIX):]
+    epoch = params.get('epoch', [''])[0]
+    if epoch and epoch != room.pages.epoch:
+        return 410, json.dumps({'error': 'Room history was reset'}).encode(), []
+    try:
+        page = room.pages.get(int(number)) if number.isdigit() else None
+    except PageGone:
+        return 410, json.dumps({'error': 'Page evicted from history'}).encode(), []
+    if page is None:
+        return 404, json.dumps({'error': 'Page not found'}).encode(), []
+    if page.sealed and epoch:
+        cache = CACHE_IMMUTABLE_PRIVATE if room.password else CACHE_IMMUTABLE
+    else:
+        cache = CACHE_REVALIDATE
+    tag = matching_etag(if_none_match, page.etag, encoding)
+    if tag:
+        return 304, b'', [('ETag', tag), ('Cache-Control', cache), ('Vary', 'Accept-Encoding')]
+    return 200, *encode_response(page.body, [('ETag', page.etag), ('Cache-Control', cache)],
+                                 encoding, lambda body, coding: page.encode(coding))
+
+
+def should_stream(entries: list[StoredMessage]) -> bool:
+    """Whether a history body is large enough to send chunked."""
+    return sum(entry.size for entry in entries) > CHUNKED_THRESHOLD
+
+
+def http_response(status: int, content: bytes, content_type: str = 'application/json',
+                  extra_headers: list[tuple[str, str]] = ()) -> bytes:
+    """Build a complete response for a connection that closes after it."""
+    reason = BaseHTTPRequestHandler.responses[status][0]
+    headers = [
+        # A 304 has no body to describe
+        *([] if status == 304 else [('Content-Type', content_type),
+                                     ('Content-Length', str(len(content)))]),
+        *extra_headers,
+        *CORS_HEADERS,
+        ('Connection', 'close'),
+    ]
+    head = f"HTTP/1.1 {status} {reason}\r\n" + ''.join(f"{k}: {v}\r\n" for k, v in headers)
+    return head.encode('latin-1') + b'\r\n' + content
+
+
+def poll_response(room: Room, after_seq: int, before_seq: Optional[int], limit: Optional[int],
+                  if_none_match: str, encoding: Optional[str]) -> bytes:
+    """Build a complete poll response, or a 304 if the client is up to date."""
+    etag = history_etag(room)
+    tag = matching_etag(if_none_match, etag, encoding)
+    if tag:
+        return http_response(304, b'', extra_headers=not_modified_headers(tag))
+    body, headers = encode_response(poll_body(room, after_seq, before_seq, limit),
+                                    [('ETag', etag), ('Cache-Control', CACHE_REVALIDATE)], encoding)
+    return http_response(200, body, extra_headers=headers)
+
+
+def busy_response(retry_after: int) -> bytes:
+    """Build the 503 sent when the server is at its connection limits."""
+    return http_response(503, json.dumps({'error': 'Server busy'}).encode(),
+                         extra_headers=[('Retry-After', str(retry_after))])
+
+
+def rooms_payload(registry: RoomRegistry) -> dict:
+    """List the hosted rooms for GET /rooms, without loading evicted ones."""
+    listing = []
+    for room_id in registry.ids():
+        room = registry.resident(room_id)
+        if room is None:
+            listing.append({'id': room_id, 'resident': False})
+            continue
+        listing.append({
+            'id': room.id,
+            'resident': True,
+            'messages': len(room.store),
+            'last_seq': room.store.last_seq,
+            'subscribers': room.fanout.subscribers,
+        })
+    return {'rooms': listing}
+
+
+def create_room(registry: RoomRegistry, body: bytes, sequenced: bool = False) -> tuple[int, dict]:
+    """Handle POST /rooms; returns the status and JSON payload.
+    
+    ``sequenced`` is set when serving with ``--workers``.
+    """
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError:
+        return 400, {'error': 'Invalid JSON'}
+    if not isinstance(data, dict):
+        return 400, {'error': 'Invalid JSON'}
+    room_id = data.get('id', '')
+    password = data.get('password', '')
+    if not isinstance(room_id, str) or not isinstance(password, str) or not password:
+        return 400, {'error': 'Room id and password required'}
+    if sequenced:
+        # Workers only share the default room through the sequencer
+        return 501, {'error': 'Rooms cannot be created when serving with --workers'}
+    try:
+        registry.create(room_id, password)
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    except RoomExists:
+        return 409, {'error': 'Room already exists'}
+    print(f"🚪 Room {room_id} created", flush=True)
+    return 201, {'ok': True, 'room': room_id}
+
+
+def delete_room(registry: RoomRegistry, room_id: str) -> tuple[int, dict]:
+    """Handle DELETE /rooms/<id>; returns the status and JSON payload."""
+    if room_id == DEFAULT_ROOM:
+        return 400, {'error': 'The default room cannot be deleted'}
+    if not registry.remove(room_id):
+        return 404, {'error': 'Room not found'}
+    print(f"🚪 Room {room_id} deleted", flush=True)
+    return 200, {'ok': True}
+
+
+def forward_messages(items: list[tuple[str, bytes, str]]) -> list[StoredMessage]:
+    """Commit a default-room batch through the parent's sequencer (``--workers``).
+    
+    The parent assigns seqs and journals; the entries come back through
+    :meth:`Room.apply` like everyone else's before this returns.
+    """
+    entries = bus.commit([data for _, data, _ in items])
+    rooms.default.note_posters(items)
+    return entries
 
 
 class ChatHandler(BaseHTTPRequestHandler):
     """HTTP request handler for the chat server."""
     
     protocol_version = 'HTTP/1.1'
+    # Stalled senders give their worker back; idle connections much sooner,
+    # see wait_for_request
+    timeout = 30
+    
+    def handle(self):
+        """Serve requests until the connection closes or idles out."""
+        self.close_connection = False
+        served = 0
+        while not self.close_connection:
+            if served and self.server.pool.queued():
+                # Don't keep a worker for a keep-alive while others wait for one
+                break
+            if not self.wait_for_request():
+                break
+            self.handle_one_request()
+            served += 1
+    
+    def wait_for_request(self) -> bool:
+        """Wait for the next request to start arriving; False to close instead.
+        
+        A connection may sit idle for IDLE_TIMEOUT, or for IDLE_POLL once
+        other connections are queued for a worker, so idle keep-alives
+        and silent clients cannot tie up the pool.
+        """
+        deadline = time.monotonic() + IDLE_TIMEOUT
+        waited = False
+        self.connection.setblocking(False)
+        try:
+            while True:
+                # Non-blocking: b'' unless a request (maybe pipelined) is waiting
+                if self.rfile.peek(1):
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (waited and self.server.pool.queued()):
+                    return False
+                readable, _, _ = select.select([self.connection], [], [],
+                                               min(remaining, IDLE_POLL))
+                if readable and not self.rfile.peek(1):
+                    return False  # closed by the client
+                waited = True
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
     
     def log_message(self, format, *args):
         """Suppress default logging."""
@@ -487,29 +1114,104 @@ class ChatHandler(BaseHTTPRequestHandler):
     
     def send_cors_headers(self):
         """Send CORS headers."""
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Room-Password')
-    
-    def check_auth(self) -> bool:
-        """Check if request has valid password."""
-        # Check header first
-        pw = self.headers.get('X-Room-Password', '')
-        if not pw:
-            # Check query param
-            parsed = urlparse(self.path)
-            params = parse_qs(parsed.query)
-            pw = params.get('password', [''])[0]
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
+    
+    def check_auth(self, password: str) -> bool:
+        """Check if request has the given password."""
+        # Header first, then query param
+        params = parse_qs(urlparse(self.path).query)
+        pw = request_password(self.headers.get('X-Room-Password', ''), params)
         
-        if not check_password(pw, room_password):
-            self.send_response(401)
+        if not check_password(pw, password):
+            self.send_json(401, {'error': 'Invalid password'})
+            return False
+        return True
+    
+    def send_json(self, status: int, data, extra_headers: list[tuple[str, str]] = ()):
+        """Send a JSON response from a dict or already-encoded bytes."""
+        content = data if isinstance(data, bytes) else json.dumps(data).encode()
+        self.send_response(status)
+        if status != 304:
             self.send_header('Content-Type', 'application/json')
-            self.send_cors_headers()
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': 'Invalid password'}).encode())
+            self.send_header('Content-Length', str(len(content)))
+        for name, value in extra_headers:
+            self.send_header(name, value)
+        self.send_cors_headers()
+        self.end_headers()
+        self.wfile.write(content)
+    
+    def check_etag(self, etag: str) -> bool:
+        """Answer 304 if the client already has ``etag``; returns True if it did."""
+        tag = matching_etag(self.headers.get('If-None-Match', ''), etag, self.accepted_encoding())
+        if tag:
+            self.send_json(304, b'', not_modified_headers(tag))
+            return True
+        return False
+    
+    def accepted_encoding(self) -> Optional[str]:
+        """The content coding to compress this request's response with, if any."""
+        return negotiate(self.headers.get('Accept-Encoding', ''))
+    
+    def send_chunked(self, status: int, chunks: Iterator[bytes],
+                     extra_headers: list[tuple[str, str]] = ()):
+        """Stream a JSON body with chunked transfer encoding."""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        for name, value in extra_headers:
+            self.send_header(name, value)
+        self.send_cors_headers()
+        self.end_headers()
+        for chunk in chunks:
+            if chunk:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+    
+    def send_busy(self):
+        """Answer 503 with Retry-After and close the connection."""
+        self.close_connection = True
+        self.wfile.write(busy_response(self.server.limits.retry_after))
+    
+    def check_rate(self, room: Room, items: list[tuple[str, bytes, str]]) -> bool:
+        """Charge a post to the rate limits, answering 429 if they are spent."""
+        ip = client_ip(self.client_address[0], self.headers.get('X-Forwarded-For', ''))
+        retry_after = rate_limit_wait(rate_limiter, room, items, ip)
+        if retry_after:
+            self.send_json(429, {'error': 'Rate limit exceeded', 'retry_after': retry_after},
+                           [('Retry-After', str(retry_after))])
             return False
         return True
     
+    def find_room(self, path: str) -> Optional[tuple[Room, str]]:
+        """Resolve a path to its room and the route within it, or answer 404."""
+        room_id, route = split_room_path(path)
+        room = rooms.get(room_id)
+        if room is None:
+            self.send_json(404, {'error': 'Room not found'})
+            return None
+        return room, route
+    
+    def read_body(self) -> bytes:
+        content_length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(content_length)
+    
+    def read_cursors(self, params: dict) -> Optional[tuple[int, Optional[int]]]:
+        """Parse after_seq/before_seq, answering 400 if they are malformed."""
+        try:
+            return parse_cursors(params)
+        except ValueError:
+            self.send_json(400, {'error': 'Cursor must be an integer seq'})
+            return None
+    
+    def read_page(self, params: dict) -> Optional[tuple[Optional[int], Optional[int]]]:
+        """Parse limit/tail, answering 400 if they are malformed."""
+        try:
+            return parse_page(params)
+        except ValueError:
+            self.send_json(400, {'error': 'limit and tail must be positive integers'})
+            return None
+    
     def do_OPTIONS(self):
         """Handle CORS preflight."""
         self.send_response(200)
@@ -519,11 +1221,32 @@ class ChatHandler(BaseHTTPRequestHandler):
     def do_GET(self):
         """Handle GET requests."""
         parsed = urlparse(self.path)
-        path = parsed.path
+        
+        if parsed.path == '/health':
+            # Health check (no auth required)
+            content = json.dumps({'status': 'ok'}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        
+        if parsed.path == '/rooms':
+            # List rooms (admin)
+            if not self.check_auth(rooms_password):
+                return
+            self.send_json(200, rooms_payload(rooms))
+            return
+        
+        found = self.find_room(parsed.path)
+        if found is None:
+            return
+        room, path = found
         
         if path == '/':
             # Serve web UI
-            if not self.check_auth():
+            if not self.check_auth(room.password):
                 return
             
             content = WEB_UI_HTML.encode()
@@ -535,92 +1258,182 @@ class ChatHandler(BaseHTTPRequestHandler):
             self.wfile.write(content)
             
         elif path == '/messages':
-            # Return all messages
-            if not self.check_auth():
+            # Return retained messages, optionally between seq cursors
+            # and a page at a time
+            if not self.check_auth(room.password):
                 return
             
-            with messages_lock:
-                data = {'messages': messages.copy()}
+            params = parse_qs(parsed.query)
+            cursors = self.read_cursors(params)
+            if cursors is None:
+                return
+            page = self.read_page(params)
+            if page is None:
+                return
             
-            content = json.dumps(data).encode()
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(content)))
-            self.send_cors_headers()
-            self.end_headers()
-            self.wfile.write(content)
+            etag = history_etag(room)
+            if self.check_etag(etag):
+                return
+            headers = [('ETag', etag), ('Cache-Control', CACHE_REVALIDATE)]
+            encoding = self.accepted_encoding()
+            entries, end = history_page(room, *cursors, *page)
+            if should_stream(entries) and self.request_version == 'HTTP/1.1':
+                # Large histories go out as they are encoded (and
+                # compressed) rather than being built up in memory first
+                chunks = history_chunks(entries, end)
+                if encoding:
+                    chunks = compress_chunks(chunks, encoding)
+                self.send_chunked(200, chunks, coded_headers(headers, encoding))
+            else:
+                self.send_json(200, *encode_response(history_body(entries, end), headers, encoding))
             
         elif path == '/messages/stream':
             # SSE stream (works on direct connections, may not work through proxies)
-            if not self.check_auth():
+            if not self.check_auth(room.password):
                 return
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/event-stream')
-            self.send_header('Cache-Control', 'no-cache, no-transform')
-            self.send_header('Connection', 'keep-alive')
-            self.send_header('X-Accel-Buffering', 'no')
-            self.send_cors_headers()
-            self.end_headers()
-            self.wfile.flush()
+            params = parse_qs(parsed.query)
+            try:
+                after_seq = stream_cursor(params, self.headers.get('Last-Event-ID', ''))
+            except ValueError:
+                self.send_json(400, {'error': 'Cursor must be an integer seq'})
+                return
+            encoding = stream_encoding(params, self.headers.get('Accept-Encoding', ''))
+            # Every write goes through this, flushed so it decodes on arrival
+            encode = stream_encoder(encoding)
             
-            # Add a queue for this client
-            q = queue.Queue()
-            with sse_lock:
-                sse_clients.append(q)
+            slots = self.server.stream_slots
+            if not slots.acquire():
+                self.send_busy()
+                return
+            release = slots.release
+            sub = None
             
             try:
-                self.wfile.write(b": connected\n\n")
+                self.send_response(200)
+                for name, value in sse_headers(encoding):
+                    self.send_header(name, value)
+                self.send_cors_headers()
+                self.end_headers()
                 self.wfile.flush()
+                # The stream only ends by closing the connection (sending
+                # `Connection: keep-alive` above cleared this)
+                self.close_connection = True
+                
+                # Subscribe before replaying so nothing falls between replay
+                # and live; the log skips whatever the replay already covered.
+                sub = room.subscribe(after_seq)
+                # A stalled connection must not block its thread forever
+                self.connection.settimeout(room.fanout.limits.write_timeout)
                 
+                data = SSE_PREAMBLE
+                if after_seq is not None:
+                    data += catch_up(room, sub)
+                self.wfile.write(encode(data))
+                self.wfile.flush()
+                
+                if mux:
+                    # The event loop owns the connection from here on
+                    self.close_connection = True
+                    self.server.detach(self.connection)
+                    mux.add_stream(self.connection, sub, functools.partial(catch_up, room),
+                                   on_close=release, encode=encode)
+                    sub = release = None
+                    return
+                
+                limits = room.fanout.limits
+                last_write = 0.0
                 while True:
-                    try:
-                        msg = q.get(timeout=15)
-                        data = f"data: {json.dumps(msg)}\n\n"
-                        self.wfile.write(data.encode())
-                        self.wfile.flush()
-                    except queue.Empty:
-                        self.wfile.write(b": keepalive\n\n")
-                        self.wfile.flush()
+                    data = read_frames(room, sub, timeout=15)
+                    if data:
+                        # Right after a write, whatever follows within the
+                        # window goes out together in the next one
+                        data = gather_frames(room, sub, data, last_write + limits.coalesce_window,
+                                             limits.coalesce_bytes)
+                    else:
+                        data = SSE_KEEPALIVE
+                    self.wfile.write(encode(data))
+                    self.wfile.flush()
+                    last_write = time.monotonic()
             except Exception:
                 pass
             finally:
-                with sse_lock:
-                    if q in sse_clients:
-                        sse_clients.remove(q)
+                if sub:
+                    sub.close()
+                if release:
+                    release()
         
         elif path == '/messages/poll':
-            # Poll endpoint: returns new messages since `after` index
-            # Non-blocking — client re-polls with backoff
-            if not self.check_auth():
+            # Poll endpoint: returns messages with seq > `after_seq`;
+            # `next` is the cursor to send on the following poll.
+            # With `wait=SECONDS` the request blocks until there is something
+            # to return; without it the client re-polls with backoff.
+            if not self.check_auth(room.password):
                 return
             
             params = parse_qs(parsed.query)
-            after = int(params.get('after', ['0'])[0])
+            cursors = self.read_cursors(params)
+            if cursors is None:
+                return
+            after_seq, before_seq = cursors
+            page = self.read_page(params)
+            if page is None:
+                return
+            limit = page[0]
+            try:
+                wait = parse_wait(params)
+            except ValueError:
+                self.send_json(400, {'error': 'wait must be a number of seconds'})
+                return
             
-            with messages_lock:
-                if len(messages) > after:
-                    new_msgs = messages[after:]
-                    data = {'messages': new_msgs, 'next': len(messages)}
-                else:
-                    data = {'messages': [], 'next': len(messages)}
+            if 0 < wait and after_seq == room.store.last_seq:
+                slots = self.server.stream_slots
+                if not slots.acquire():
+                    self.send_busy()
+                    return
+                if mux:
+                    # Park the request on the event loop and free this thread
+                    self.close_connection = True
+                    self.server.detach(self.connection)
+                    mux.add_poll(
+                        self.connection, room.fanout, after_seq, wait,
+                        functools.partial(poll_response, room, after_seq, before_seq, limit,
+                                          self.headers.get('If-None-Match', ''),
+                                          self.accepted_encoding()),
+                        on_close=slots.release,
+                    )
+                    return
+                try:
+                    room.fanout.wait(after_seq, wait)
+                finally:
+                    slots.release()
             
-            content = json.dumps(data).encode()
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(content)))
-            self.send_cors_headers()
-            self.end_headers()
-            self.wfile.write(content)
+            # Nothing new since the client's last poll costs a bodiless 304
+            etag = history_etag(room)
+            if self.check_etag(etag):
+                return
+            self.send_json(200, *encode_response(poll_body(room, after_seq, before_seq, limit),
+                                                 [('ETag', etag), ('Cache-Control', CACHE_REVALIDATE)],
+                                                 self.accepted_encoding()))
         
-        elif path == '/health':
-            # Health check (no auth required)
-            content = json.dumps({'status': 'ok'}).encode()
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(content)))
-            self.end_headers()
-            self.wfile.write(content)
+        elif path.startswith(PAGES_PREFIX):
+            # Fixed, cacheable page of history
+            if not self.check_auth(room.password):
+                return
+            
+            status, body, headers = page_response(room, path, parse_qs(parsed.query),
+                                                  self.headers.get('If-None-Match', ''),
+                                                  self.accepted_encoding())
+            self.send_json(status, body, headers)
+        
+        elif path == '/stats':
+            # Store counters (retained and evicted messages)
+            if not self.check_auth(room.password):
+                return
+            
+            stats = stats_payload(room, rooms, rate_limiter, mux)
+            stats['server'] = self.server.stats()
+            self.send_json(200, stats)
         
         else:
             self.send_response(404)
@@ -631,66 +1444,82 @@ class ChatHandler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Handle POST requests."""
         parsed = urlparse(self.path)
-        path = parsed.path
+        
+        if parsed.path == '/rooms':
+            # Create a room (admin)
+            if not self.check_auth(rooms_password):
+                return
+            status, payload = create_room(rooms, self.read_body(), sequenced=bus is not None)
+            self.send_json(status, payload)
+            return
+        
+        found = self.find_room(parsed.path)
+        if found is None:
+            return
+        room, path = found
         
         if path == '/messages':
-            if not self.check_auth():
+            if not self.check_auth(room.password):
                 return
             
-            # Read body
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
-            
             try:
-                data = json.loads(body)
-            except json.JSONDecodeError:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Invalid JSON'}).encode())
+                item = new_message(self.read_body())
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
                 return
-            
-            agent = data.get('agent', 'anonymous')
-            text = data.get('text', '')
-            
-            if not text:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Message text required'}).encode())
+            if not self.check_rate(room, [item]):
                 return
             
-            # Create message
-            msg = {
-                'agent': agent,
-                'text': text,
-                'timestamp': datetime.now(timezone.utc).isoformat()
-            }
-            
-            # Store message
-            with messages_lock:
-                messages.append(msg)
+            # The ingest thread stores, journals, tracks the agent,
+            # broadcasts and logs the whole batch
+            try:
+                entry = room.ingest.submit(item)
+            except Exception:
+                self.send_json(500, {'error': 'Failed to store message'})
+                return
             
-            # Track agent
-            with agents_lock:
-                connected_agents.add(agent)
+            # Response (sent once the batch has committed)
+            self.send_json(200, posted_body(entry))
+        
+        elif path == '/messages/batch':
+            if not self.check_auth(room.password):
+                return
             
-            # Broadcast to SSE clients
-            broadcast_message(msg)
+            try:
+                items = new_messages(self.read_body())
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            if not self.check_rate(room, items):
+                return
             
-            # Log to console
-            print(f"[{msg['timestamp'][:19]}] {agent}: {text}", flush=True)
+            # Submitted as one unit, so the messages commit together with
+            # consecutive seqs
+            try:
+                entries = room.ingest.submit_many(items)
+            except Exception:
+                self.send_json(500, {'error': 'Failed to store messages'})
+                return
             
-            # Response
-            content = json.dumps({'ok': True, 'message': msg}).encode()
-            self.send_response(200)
+            self.send_json(200, batch_posted_body(entries))
+        
+        else:
+            self.send_response(404)
             self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(content)))
-            self.send_cors_headers()
             self.end_headers()
-            self.wfile.write(content)
+            self.wfile.write(json.dumps({'error': 'Not found'}).encode())
+    
+    def do_DELETE(self):
+        """Handle DELETE requests."""
+        path = urlparse(self.path).path
+        room_id, route = split_room_path(path)
+        
+        if path.startswith('/rooms/') and route == '/':
+            # Tear down a room (admin)
+            if not self.check_auth(rooms_password):
+                return
+            status, payload = delete_room(rooms, room_id)
+            self.send_json(status, payload)
         
         else:
             self.send_response(404)
@@ -700,19 +1529,70 @@ class ChatHandler(BaseHTTPRequestHandler):
 
 
 class ThreadedHTTPServer(HTTPServer):
-    """HTTP server that handles each request in a new thread."""
+    """HTTP server that handles requests on a fixed pool of threads.
+    
+    ``limits`` bounds the threads, the queue of accepted connections and
+    the number of open streams. A connection that arrives to a full queue
+    is answered 503 from the accept loop without ever reaching a worker.
+    """
     
     allow_reuse_address = True
+    # socketserver's default listen backlog of 5 resets bursts of posters
+    request_queue_size = 128
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.daemon_threads = True
+    def __init__(self, server_address, handler_class,
+                 limits: Optional[ConnectionLimits] = None, reuse_port: bool = False):
+        self.reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
+        self.limits = limits or ConnectionLimits()
+        # Streams and long-polls hold a worker each unless they are handed
+        # to the multiplexer, so they get workers beyond `threads`
+        threads = self.limits.threads + (0 if mux else self.limits.max_streams)
+        self.pool = WorkerPool(self.process_request_thread, threads, self.limits.backlog)
+        self.stream_slots = Slots(self.limits.max_streams)
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+    
+    def server_bind(self):
+        if self.reuse_port:
+            # Each --workers process listens on the port; the kernel spreads
+            # new connections across them
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+    
+    def detach(self, request):
+        """Keep the connection open after its handler returns."""
+        with self._detached_lock:
+            self._detached.add(request)
+    
+    def shutdown_request(self, request):
+        """Close the connection unless it was detached."""
+        with self._detached_lock:
+            if request in self._detached:
+                self._detached.discard(request)
+                return
+        super().shutdown_request(request)
     
     def process_request(self, request, client_address):
-        """Start a new thread to handle the request."""
-        thread = threading.Thread(target=self.process_request_thread, args=(request, client_address))
-        thread.daemon = True
-        thread.start()
+        """Queue the connection for a worker, or turn it away if the queue is full."""
+        if not self.pool.submit(request, client_address):
+            self.reject(request)
+    
+    def reject(self, request):
+        """Answer 503 without blocking the accept loop, then close."""
+        try:
+            request.setblocking(False)
+            request.sendall(busy_response(self.limits.retry_after))
+            # Read what has arrived of the request, so closing doesn't reset
+            # the connection before the client sees the response
+            request.recv(65536)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+    
+    def stats(self) -> dict:
+        """Return worker pool and stream slot counters."""
+        return {'workers': self.pool.stats(), 'streams': self.stream_slots.stats()}
     
     def process_request_thread(self, request, client_address):
         """Process request in thread."""
@@ -845,13 +1725,121 @@ def start_tunnel(port: int, cloudflared_path: str) -> tuple[int, str]:
     raise RuntimeError("Failed to get tunnel URL from cloudflared")
 
 
-def serve(password: str, port: int = 8765, tunnel: Optional[str] = None):
-    """Start the chat server."""
-    global room_password
-    room_password = password
+def serve(password: str, port: int = 8765, tunnel: Optional[str] = None,
+          retention: Optional[RetentionPolicy] = None,
+          message_store: Optional[MessageStore] = None,
+          journal_path: Optional[str] = None, fsync: str = 'batch',
+          fsync_interval: float = 0.05, batch_window: float = 0.002,
+          subscriber_limits: Optional[SubscriberLimits] = None,
+          stream_mux: bool = False, engine: str = 'threaded',
+          connection_limits: Optional[ConnectionLimits] = None, workers: int = 1,
+          admin_password: Optional[str] = None, state_dir: Optional[str] = None,
+          room_idle: Optional[float] = None, rate_limits: Optional[RateLimits] = None,
+          agent_weights: Optional[dict[str, int]] = None):
+    """Start the chat server.
+    
+    Pass ``message_store`` to plug in a different store backend; otherwise a
+    ring buffer bounded by ``retention`` is used. With ``journal_path`` the
+    room is replayed from that file on startup and every message is appended
+    to it. POSTs arriving within ``batch_window`` seconds are committed as one
+    batch. ``subscriber_limits`` sets how slow stream consumers are handled.
+    With ``stream_mux``, SSE streams and long-polls are served from a single
+    event-loop thread once their headers are parsed. ``engine='asyncio'``
+    serves every connection from one asyncio event loop instead of a thread
+    per connection. ``connection_limits`` bounds the threaded engine's
+    workers, queued connections and open streams.
+    
+    With ``workers`` > 1, that many processes are forked, each listening on
+    ``port`` with SO_REUSEPORT. This process then only sequences: it assigns
+    seqs, writes the journal and broadcasts every message to all workers
+    over a Unix socket, so each worker's streams see every post.
+    
+    ``password`` guards the default room, which also answers the top-level
+    routes. More rooms, each with its own password and history, can be
+    created and deleted at runtime under ``/rooms`` with ``admin_password``
+    (default: ``password``); they get the same retention and limits.
+    With ``state_dir`` those rooms are journaled there and survive restarts,
+    and with ``room_idle`` a room with no subscribers or requests for that
+    many seconds is dropped from memory until its next request.
+    
+    Posts are committed round robin across agents, so a bursting agent
+    does not delay the others; ``agent_weights`` gives some agents a
+    larger share. ``rate_limits`` caps how fast each agent and client
+    address may post; past it, posts are answered 429 with Retry-After.
+    With ``workers`` each process keeps its own buckets.
+    """
+    global rooms, rooms_password, rate_limiter
+    if workers > 1 and state_dir:
+        # Each worker would load and number the state dir's rooms on its own
+        raise ValueError("state_dir cannot be used with workers > 1")
+    retention = retention or RetentionPolicy()
+    rooms_password = admin_password or password
+    if rate_limits and rate_limits.enabled:
+        rate_limiter = RateLimiter(rate_limits)
+    
+    def make_room(room_id: str, room_password: str, journal_path: Optional[str] = None,
+                  store: Optional[MessageStore] = None, journal: Optional[Journal] = None,
+                  epoch: Optional[str] = None) -> Room:
+        store = store if store is not None else RingBufferStore(retention)
+        if journal_path:
+            load_journal(journal_path, store, keep=retention.max_count)
+            journal = Journal(journal_path, fsync=fsync, fsync_interval=fsync_interval)
+        return Room(room_id, room_password, store, journal,
+                    batch_window=batch_window, subscriber_limits=subscriber_limits,
+                    agent_weights=agent_weights, epoch=epoch)
     
-    # Start HTTP server
-    server = ThreadedHTTPServer(('0.0.0.0', port), ChatHandler)
+    rooms = RoomRegistry(make_room, state_dir=state_dir, idle_timeout=room_idle)
+    store = message_store if message_store is not None else RingBufferStore(retention)
+    journal = None
+    
+    if journal_path:
+        replayed = load_journal(journal_path, store, keep=retention.max_count)
+        print(f"📜 Replayed {replayed} messages from {journal_path}", flush=True)
+    
+    def start_http(reuse_port=False):
+        global mux
+        if engine == 'asyncio':
+            from agent_chatroom.aioserver import AsyncChatServer
+            # Handed over explicitly: run as `python -m agent_chatroom.server`,
+            # this module is __main__, not the agent_chatroom.server that
+            # aioserver imports
+            return AsyncChatServer(('0.0.0.0', port), rooms, rooms_password,
+                                   rate_limiter=rate_limiter, sequenced=workers > 1,
+                                   reuse_port=reuse_port)
+        if stream_mux:
+            limits = subscriber_limits or SubscriberLimits()
+            mux = StreamMultiplexer(write_timeout=limits.write_timeout,
+                                    coalesce_window=limits.coalesce_window,
+                                    coalesce_bytes=limits.coalesce_bytes)
+            rooms.add_listener(mux.notify)
+        return ThreadedHTTPServer(('0.0.0.0', port), ChatHandler, connection_limits,
+                                  reuse_port=reuse_port)
+    
+    server = sequencer = None
+    worker_pids = []
+    # Shared by every worker's copy of the default room, and kept with the journal
+    epoch = journal_epoch(journal_path) if journal_path else new_epoch()
+    if workers > 1:
+        # Fork before this process starts any threads
+        sequencer = Sequencer(os.path.join(tempfile.mkdtemp(prefix='agent-chat-'), 'bus.sock'),
+                              store)
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                room = make_room(DEFAULT_ROOM, password, store=store, epoch=epoch)
+                run_worker(sequencer, rooms.add(room),
+                           functools.partial(start_http, reuse_port=True))
+            worker_pids.append(pid)
+        print(f"👷 {workers} worker processes on port {port}", flush=True)
+    
+    if journal_path:
+        journal = Journal(journal_path, fsync=fsync, fsync_interval=fsync_interval)
+    
+    if sequencer:
+        sequencer.journal = journal
+    else:
+        rooms.add(make_room(DEFAULT_ROOM, password, store=store, journal=journal, epoch=epoch))
+        server = start_http()
     
     tunnel_pid = None
     public_url = f"http://localhost:{port}"
@@ -892,7 +1880,21 @@ Watch the live chat: {public_url}/?password={password}""", flush=True)
                 os.kill(tunnel_pid, signal.SIGTERM)
             except ProcessLookupError:
                 pass
-        server.shutdown()
+        for pid in worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for room in rooms:
+            room.close()
+        if journal:
+            journal.close()
+        if sequencer:
+            sequencer.close()
+            os.unlink(sequencer.path)
+            os.rmdir(os.path.dirname(sequencer.path))
+        if server:
+            server.shutdown()
         sys.exit(0)
     
     signal.signal(signal.SIGINT, shutdown)
@@ -900,11 +1902,166 @@ Watch the live chat: {public_url}/?password={password}""", flush=True)
     
     # Serve forever
     try:
-        server.serve_forever()
+        if sequencer:
+            sequencer.serve_forever()
+        else:
+            server.serve_forever()
     except KeyboardInterrupt:
         shutdown(None, None)
 
 
+def run_worker(sequencer: Sequencer, room: Room, start_http: Callable):
+    """Serve ``room`` over HTTP in a forked ``--workers`` process; never returns."""
+    global bus
+    # The parent handles Ctrl-C and stops the workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    sequencer.close()
+    
+    def lost_sequencer():
+        print(f"💀 worker {os.getpid()} lost its sequencer, exiting", flush=True)
+        os._exit(1)
+    
+    bus = BusClient(sequencer.path, room.apply, on_disconnect=lost_sequencer)
+    room.ingest = IngestPipeline(forward_messages, window=room.ingest.window,
+                                 key=room.ingest.key, weights=room.ingest.weights)
+    server = start_http()
+    bus.start(room.store.last_seq)
+    try:
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def agent_weight(value: str) -> tuple[str, int]:
+    """Parse an `--agent-weight AGENT=N` option."""
+    agent, _, weight = value.rpartition('=')
+    try:
+        if agent and int(weight) >= 1:
+            return agent, int(weight)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"expected AGENT=N with N >= 1, got {value!r}")
+
+
+def add_serve_arguments(parser: argparse.ArgumentParser):
+    """Add the `serve` command options to a parser."""
+    parser.add_argument("--password", "-p", required=True, help="Room password")
+    parser.add_argument("--admin-password", default=None,
+                        help="Password for creating and deleting rooms (default: --password)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--tunnel", choices=["cloudflared"], help="Create tunnel")
+    parser.add_argument("--max-messages", type=int, default=10000,
+                        help="Messages to keep in history (default: 10000)")
+    parser.add_argument("--max-bytes", type=int, default=None,
+                        help="Cap on serialized history size in bytes")
+    parser.add_argument("--max-age", type=float, default=None,
+                        help="Drop messages older than this many seconds")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="Persist messages to this file and replay it on startup")
+    parser.add_argument("--fsync", choices=FSYNC_MODES, default="batch",
+                        help="When journal writes reach the disk (default: batch)")
+    parser.add_argument("--fsync-interval", type=float, default=50, metavar="MS",
+                        help="Milliseconds between syncs in batch mode (default: 50)")
+    parser.add_argument("--batch-window", type=float, default=2, metavar="MS",
+                        help="Milliseconds to gather concurrent posts into one commit (default: 2)")
+    parser.add_argument("--stream-max-lag", type=int, default=1000, metavar="N",
+                        help="Messages a stream may fall behind before --slow-consumer applies (default: 1000)")
+    parser.add_argument("--stream-max-lag-bytes", type=int, default=None, metavar="BYTES",
+                        help="Bytes a stream may fall behind before --slow-consumer applies")
+    parser.add_argument("--slow-consumer", choices=OVERFLOW_POLICIES, default="catch-up",
+                        help="What to do with a stream that falls behind (default: catch-up)")
+    parser.add_argument("--stream-coalesce", type=float, default=5, metavar="MS",
+                        help="Gather messages that follow a stream's last write within this "
+                             "window into one write; 0 writes each at once (default: 5)")
+    parser.add_argument("--stream-mux", action="store_true",
+                        help="Serve SSE streams and long-polls from one event-loop thread")
+    parser.add_argument("--engine", choices=ENGINES, default="threaded",
+                        help="Server implementation: a pool of threads, or one asyncio loop (default: threaded)")
+    parser.add_argument("--state-dir", metavar="DIR",
+                        help="Journal rooms created under /rooms here so they survive restarts")
+    parser.add_argument("--room-idle", type=float, default=None, metavar="SECONDS",
+                        help="Unload rooms idle this long from memory until their next request (needs --state-dir)")
+    parser.add_argument("--agent-weight", action="append", type=agent_weight, default=[],
+                        metavar="AGENT=N",
+                        help="Commit N of this agent's queued messages per turn instead of 1 (repeatable)")
+    parser.add_argument("--agent-rate", type=float, default=None, metavar="PER_SEC",
+                        help="Messages per second each agent may post once its burst is spent (default: unlimited)")
+    parser.add_argument("--agent-burst", type=int, default=20, metavar="N",
+                        help="Messages an agent may post at once before --agent-rate applies (default: 20)")
+    parser.add_argument("--ip-rate", type=float, default=None, metavar="PER_SEC",
+                        help="Messages per second each client address may post once its burst is spent (default: unlimited)")
+    parser.add_argument("--ip-burst", type=int, default=60, metavar="N",
+                        help="Messages an address may post at once before --ip-rate applies (default: 60)")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="Processes serving the port, sharing messages over a local bus (default: 1)")
+    parser.add_argument("--threads", type=int, default=32, metavar="N",
+                        help="Worker threads for requests (default: 32)")
+    parser.add_argument("--backlog", type=int, default=128, metavar="N",
+                        help="Accepted connections that may wait for a worker before 503s (default: 128)")
+    parser.add_argument("--max-streams", type=int, default=256, metavar="N",
+                        help="Open SSE streams and long-polls before 503s (default: 256)")
+
+
+def check_serve_args(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """Reject `serve` options that cannot work, alone or together."""
+    if args.workers > 1 and args.state_dir:
+        # Only the default room is sequenced across workers, so rooms
+        # cannot be created either
+        parser.error("--state-dir cannot be used with --workers")
+    if args.room_idle is not None and not args.state_dir:
+        parser.error("--room-idle needs --state-dir to unload rooms to")
+    problems = [
+        (args.room_idle is not None and args.room_idle <= 0, "--room-idle must be positive"),
+        (args.max_messages < 1, "--max-messages must be at least 1"),
+        (args.stream_coalesce < 0, "--stream-coalesce must not be negative"),
+        (args.workers < 1, "--workers must be at least 1"),
+        (args.threads < 1, "--threads must be at least 1"),
+        (args.backlog < 1, "--backlog must be at least 1"),
+        (args.max_streams < 0, "--max-streams must not be negative"),
+        (args.agent_rate is not None and args.agent_rate <= 0, "--agent-rate must be positive"),
+        (args.ip_rate is not None and args.ip_rate <= 0, "--ip-rate must be positive"),
+        (args.agent_burst < 1 or args.ip_burst < 1, "--agent-burst and --ip-burst must be at least 1"),
+    ]
+    for bad, message in problems:
+        if bad:
+            parser.error(message)
+
+
+def serve_from_args(args: argparse.Namespace):
+    """Start the chat server from parsed `serve` arguments."""
+    retention = RetentionPolicy(
+        max_count=args.max_messages,
+        max_bytes=args.max_bytes,
+        max_age=args.max_age,
+    )
+    serve(args.password, args.port, args.tunnel, retention=retention,
+          journal_path=args.journal, fsync=args.fsync,
+          fsync_interval=args.fsync_interval / 1000,
+          batch_window=args.batch_window / 1000,
+          subscriber_limits=SubscriberLimits(
+              max_messages=args.stream_max_lag,
+              max_bytes=args.stream_max_lag_bytes,
+              on_overflow=args.slow_consumer,
+              coalesce_window=args.stream_coalesce / 1000,
+          ),
+          stream_mux=args.stream_mux, engine=args.engine,
+          connection_limits=ConnectionLimits(
+              threads=args.threads,
+              backlog=args.backlog,
+              max_streams=args.max_streams,
+          ),
+          workers=args.workers, admin_password=args.admin_password,
+          state_dir=args.state_dir, room_idle=args.room_idle,
+          rate_limits=RateLimits(
+              agent_rate=args.agent_rate,
+              agent_burst=args.agent_burst,
+              ip_rate=args.ip_rate,
+              ip_burst=args.ip_burst,
+          ),
+          agent_weights=dict(args.agent_weight))
+
+
 def main():
     """CLI entry point for server."""
     parser = argparse.ArgumentParser(description="agent-chat server")
@@ -912,14 +2069,13 @@ def main():
     
     # serve command
     serve_parser = subparsers.add_parser("serve", help="Start the chat server")
-    serve_parser.add_argument("--password", "-p", required=True, help="Room password")
-    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
-    serve_parser.add_argument("--tunnel", choices=["cloudflared"], help="Create tunnel")
+    add_serve_arguments(serve_parser)
     
     args = parser.parse_args()
     
     if args.command == "serve":
-        serve(args.password, args.port, args.tunnel)
+        check_serve_args(serve_parser, args)
+        serve_from_args(args)
 
 
 if __name__ == "__main__":
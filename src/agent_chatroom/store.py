@@ -0,0 +1,264 @@
+"""In-memory message store with retention policies."""
+
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class RetentionPolicy:
+    """Limits on how much history a store keeps.
+
+    ``max_count`` also sizes the ring buffer, so it is always bounded.
+    ``max_bytes`` caps the serialized size of retained messages and
+    ``max_age`` drops messages older than that many seconds.
+    """
+
+    max_count: int = 10000
+    max_bytes: Optional[int] = None
+    max_age: Optional[float] = None
+
+
+def encode_message(msg: dict) -> bytes:
+    """Encode a message (without its seq) to canonical JSON bytes."""
+    return json.dumps(msg).encode()
+
+
+class StoredMessage:
+    """A stored message, kept only as its canonical JSON bytes.
+
+    ``data`` is what every read path sends, so a message is serialized once
+    no matter how many responses and streams include it.
+    """
+
+    __slots__ = ('seq', 'data', 'stored_at')
+
+    def __init__(self, seq: int, data: bytes, stored_at: float):
+        self.seq = seq
+        self.data = data
+        self.stored_at = stored_at
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+class MessageStore(ABC):
+    """Interface for message store backends.
+
+    Every message gets a ``seq`` that increases monotonically from 1 and is
+    never reused, so it stays a valid cursor after older messages have been
+    evicted.
+    """
+
+    @abstractmethod
+    def append(self, data: bytes) -> StoredMessage:
+        """Store an encoded message under the next seq and return its entry.
+
+        ``data`` is the output of :func:`encode_message`; the seq is spliced
+        in as the first key.
+        """
+
+    def extend(self, datas: list[bytes]) -> list[StoredMessage]:
+        """Append several encoded messages with consecutive seqs."""
+        return [self.append(data) for data in datas]
+
+    @abstractmethod
+    def insert(self, entry: StoredMessage):
+        """Store an entry that already has a seq, e.g. one replayed from disk.
+
+        The seq must be greater than :attr:`last_seq`; the counter continues
+        from it.
+        """
+
+    @abstractmethod
+    def read(self, after_seq: int = 0, before_seq: Optional[int] = None,
+             limit: Optional[int] = None) -> list[StoredMessage]:
+        """Return retained entries with ``after_seq < seq < before_seq``.
+
+        With ``limit``, only the oldest ``limit`` of them.
+        """
+
+    def tail(self, count: int, after_seq: int = 0,
+             before_seq: Optional[int] = None) -> list[StoredMessage]:
+        """Return the newest ``count`` entries of :meth:`read`, oldest first."""
+        entries = self.read(after_seq, before_seq)
+        return entries[max(len(entries) - count, 0):]
+
+    @property
+    @abstractmethod
+    def last_seq(self) -> int:
+        """Seq of the newest message ever stored (0 if none)."""
+
+    @property
+    @abstractmethod
+    def first_seq(self) -> int:
+        """Lowest seq not yet evicted; every later seq is still retained."""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Return counters describing the store's contents and evictions."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of retained messages."""
+
+
+class RingBufferStore(MessageStore):
+    """Fixed-capacity ring buffer that evicts the oldest messages first.
+
+    The entry for ``seq`` lives in slot ``seq % capacity``, so cursor reads
+    locate their start without scanning. Slots for seqs skipped by
+    :meth:`insert` hold ``None``.
+    """
+
+    def __init__(self, policy: Optional[RetentionPolicy] = None):
+        self.policy = policy or RetentionPolicy()
+        if self.policy.max_count < 1:
+            raise ValueError("max_count must be at least 1")
+        self._capacity = self.policy.max_count
+        self._buf: list[Optional[StoredMessage]] = [None] * self._capacity
+        self._head = 1  # seq of the oldest retained message
+        self._next = 1  # seq the next message will get
+        self._count = 0
+        self._bytes = 0
+        self._evicted = 0
+        self._evicted_bytes = 0
+        self._lock = threading.Lock()
+
+    def _evict_oldest(self):
+        slot = self._head % self._capacity
+        entry = self._buf[slot]
+        self._buf[slot] = None
+        self._head += 1
+        if entry is None:
+            return
+        self._count -= 1
+        self._bytes -= entry.size
+        self._evicted += 1
+        self._evicted_bytes += entry.size
+
+    def _enforce(self, now: float):
+        """Evict until every retention limit holds. Caller holds the lock."""
+        policy = self.policy
+        while self._next - self._head > self._capacity:
+            self._evict_oldest()
+        if policy.max_bytes is not None:
+            while self._bytes > policy.max_bytes and self._head < self._next:
+                self._evict_oldest()
+        if policy.max_age is not None:
+            cutoff = now - policy.max_age
+            while self._head < self._next:
+                entry = self._buf[self._head % self._capacity]
+                if entry is not None and entry.stored_at >= cutoff:
+                    break
+                self._evict_oldest()
+
+    def _append_locked(self, data: bytes, now: float) -> StoredMessage:
+        if self._next - self._head == self._capacity:
+            self._evict_oldest()
+        entry = StoredMessage(self._next, b'{"seq": %d, ' % self._next + data[1:], now)
+        self._buf[self._next % self._capacity] = entry
+        self._next += 1
+        self._count += 1
+        self._bytes += entry.size
+        return entry
+
+    def append(self, data: bytes) -> StoredMessage:
+        now = time.time()
+        with self._lock:
+            entry = self._append_locked(data, now)
+            self._enforce(now)
+        return entry
+
+    def extend(self, datas: list[bytes]) -> list[StoredMessage]:
+        now = time.time()
+        with self._lock:
+            entries = [self._append_locked(data, now) for data in datas]
+            self._enforce(now)
+        return entries
+
+    def insert(self, entry: StoredMessage):
+        with self._lock:
+            if entry.seq < self._next:
+                raise ValueError(f"seq {entry.seq} is not after {self._next - 1}")
+            # Skip over missing seqs, dropping whatever they push out of the ring
+            if entry.seq - self._next >= self._capacity:
+                while self._head < self._next:
+                    self._evict_oldest()
+                self._head = self._next = entry.seq
+            while self._next < entry.seq:
+                if self._next - self._head == self._capacity:
+                    self._evict_oldest()
+                self._buf[self._next % self._capacity] = None
+                self._next += 1
+            if self._next - self._head == self._capacity:
+                self._evict_oldest()
+            self._buf[self._next % self._capacity] = entry
+            self._next += 1
+            self._count += 1
+            self._bytes += entry.size
+            self._enforce(time.time())
+
+    def read(self, after_seq: int = 0, before_seq: Optional[int] = None,
+             limit: Optional[int] = None) -> list[StoredMessage]:
+        with self._lock:
+            self._enforce(time.time())
+            start = max(after_seq + 1, self._head)
+            end = self._next if before_seq is None else min(before_seq, self._next)
+            if limit is None:
+                entries = [self._buf[seq % self._capacity] for seq in range(start, end)]
+                return [entry for entry in entries if entry is not None]
+            return self._collect(range(start, end), limit)
+
+    def tail(self, count: int, after_seq: int = 0,
+             before_seq: Optional[int] = None) -> list[StoredMessage]:
+        with self._lock:
+            self._enforce(time.time())
+            start = max(after_seq + 1, self._head)
+            end = self._next if before_seq is None else min(before_seq, self._next)
+            entries = self._collect(range(end - 1, start - 1, -1), count)
+        entries.reverse()
+        return entries
+
+    def _collect(self, seqs: range, limit: int) -> list[StoredMessage]:
+        """Up to ``limit`` entries for ``seqs``, in that order. Caller holds the lock."""
+        entries = []
+        for seq in seqs:
+            if len(entries) >= limit:
+                break
+            entry = self._buf[seq % self._capacity]
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    @property
+    def last_seq(self) -> int:
+        with self._lock:
+            return self._next - 1
+
+    @property
+    def first_seq(self) -> int:
+        with self._lock:
+            self._enforce(time.time())
+            return self._head
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._enforce(time.time())
+            return {
+                'count': self._count,
+                'bytes': self._bytes,
+                'capacity': self._capacity,
+                'first_seq': self._head,
+                'last_seq': self._next - 1,
+                'evicted': self._evicted,
+                'evicted_bytes': self._evicted_bytes,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
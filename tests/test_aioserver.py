@@ -0,0 +1,55 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from agent_chatroom.aioserver import AsyncChatServer
+from agent_chatroom.rooms import DEFAULT_ROOM, Room, RoomRegistry
+
+
+@pytest.fixture
+def aio_server():
+    rooms = RoomRegistry()
+    rooms.add(Room(DEFAULT_ROOM, ''))
+    srv = AsyncChatServer(('127.0.0.1', 0), rooms, '')
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    thread.join(3)
+
+
+def exchange(srv, *parts, timeout=3):
+    """Send ``parts`` one at a time, reading a response after each; returns all responses."""
+    responses = []
+    with socket.create_connection(srv.sock.getsockname(), timeout=timeout) as sock:
+        for part in parts:
+            sock.sendall(part)
+            responses.append(sock.recv(65536))
+    return responses
+
+
+def status(response):
+    return int(response.split(b' ', 2)[1])
+
+
+def test_unsupported_method_gets_501(aio_server):
+    [response] = exchange(aio_server, b'PUT /messages HTTP/1.1\r\nContent-Length: 0\r\n\r\n')
+    assert status(response) == 501
+
+
+@pytest.mark.parametrize('length', [b'abc', b'-1', b'1_0', b''])
+def test_malformed_content_length_gets_400(aio_server, length):
+    [response] = exchange(aio_server, b'POST /messages HTTP/1.1\r\nContent-Length: '
+                          + length + b'\r\n\r\n')
+    assert status(response) == 400
+
+
+def test_expect_100_continue_is_acknowledged(aio_server):
+    body = json.dumps({'agent': 'a', 'text': 'hi'}).encode()
+    head = (b'POST /messages HTTP/1.1\r\nContent-Type: application/json\r\n'
+            b'Expect: 100-continue\r\nContent-Length: %d\r\n\r\n' % len(body))
+    interim, final = exchange(aio_server, head, body)
+    assert interim == b'HTTP/1.1 100 Continue\r\n\r\n'
+    assert status(final) == 200
@@ -0,0 +1,27 @@
+import threading
+import time
+
+from agent_chatroom.bus import BusClient, Sequencer
+from agent_chatroom.rooms import Room
+from agent_chatroom.store import RingBufferStore
+
+
+def test_broadcast_does_not_overtake_catch_up(tmp_path):
+    store = RingBufferStore()
+    store.extend([b'{"text": "before"}'])
+    sequencer = Sequencer(str(tmp_path / 'bus.sock'), store)
+    threading.Thread(target=sequencer.serve_forever, daemon=True).start()
+
+    late = Room('default', 'pw')
+    late_bus = BusClient(sequencer.path, late.apply)
+    early = BusClient(sequencer.path, lambda entries: None)
+    early.start(store.last_seq)
+    # Sequenced while the late worker is connected but not caught up yet
+    early.commit([b'{"text": "during"}'])
+    time.sleep(0.05)
+    late_bus.start(late.store.last_seq)
+
+    deadline = time.monotonic() + 2
+    while late.store.last_seq < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [entry.seq for entry in late.store.read(0)] == [1, 2]
@@ -0,0 +1,25 @@
+import pytest
+
+from agent_chatroom.compression import encoded_etag, negotiate
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('', None),
+    ('gzip, deflate', 'gzip'),
+    ('deflate', 'deflate'),
+    ('gzip;q=0.5, deflate', 'deflate'),
+    ('GZIP', 'gzip'),
+    ('gzip;q=0', None),
+    ('gzip;q=0, *', 'deflate'),
+    ('*', 'gzip'),
+    ('*;q=0', None),
+    ('identity', None),
+    ('identity, gzip;q=0.1', 'gzip'),
+    ('gzip;q=bogus', None),
+])
+def test_negotiate(header, expected):
+    assert negotiate(header) == expected
+
+
+def test_encoded_etag_keeps_the_quotes():
+    assert encoded_etag('"abc"', 'gzip') == '"abc-gzip"'
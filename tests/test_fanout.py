@@ -0,0 +1,79 @@
+import pytest
+
+from agent_chatroom.fanout import FanOut, Lagged, SlowConsumer, SubscriberLimits, sse_frame
+from agent_chatroom.store import StoredMessage
+
+DATA = b'{"text": "hello"}'
+
+
+def published(count, after=0, **limits):
+    """A fan-out holding ``count`` messages past ``after`` and a subscriber at ``after``."""
+    fanout = FanOut(limits=SubscriberLimits(**limits))
+    sub = fanout.subscribe(after)
+    fanout.publish([StoredMessage(seq, DATA, 0.0) for seq in range(after + 1, after + count + 1)])
+    assert fanout.wait(after + count - 1, timeout=2)
+    return fanout, sub
+
+
+def frame_size(seq):
+    return len(sse_frame(StoredMessage(seq, DATA, 0.0)))
+
+
+def test_catch_up_sends_a_lagging_subscriber_to_the_store():
+    fanout, sub = published(5, max_messages=3, on_overflow='catch-up')
+    with pytest.raises(Lagged):
+        sub.read(timeout=0)
+    assert sub.cursor == 0
+    assert fanout.catch_ups == 1
+    assert fanout.dropped_messages == 0
+    fanout.close()
+
+
+def test_catch_up_once_the_cursor_is_trimmed_from_the_log():
+    fanout = FanOut(max_events=2, limits=SubscriberLimits(max_messages=None))
+    sub = fanout.subscribe(0)
+    fanout.publish([StoredMessage(seq, DATA, 0.0) for seq in range(1, 11)])
+    assert fanout.wait(9, timeout=2)
+    with pytest.raises(Lagged):
+        sub.read(timeout=0)
+    fanout.close()
+
+
+def test_disconnect_drops_a_lagging_subscriber():
+    fanout, sub = published(5, max_messages=3, on_overflow='disconnect')
+    with pytest.raises(SlowConsumer) as raised:
+        sub.read(timeout=0)
+    assert not isinstance(raised.value, Lagged)
+    assert fanout.subscribers_disconnected == 1
+    fanout.close()
+
+
+def test_subscriber_within_limits_reads_everything():
+    fanout, sub = published(3, max_messages=3, on_overflow='disconnect')
+    assert [seq for seq, _ in sub.read(timeout=0)] == [1, 2, 3]
+    assert sub.cursor == 3
+    fanout.close()
+
+
+def test_drop_oldest_by_count_keeps_the_newest():
+    fanout, sub = published(10, max_messages=3, on_overflow='drop-oldest')
+    events = sub.read(timeout=0)
+    assert [seq for seq, _ in events] == [8, 9, 10]
+    assert fanout.dropped_messages == 7
+    assert fanout.subscribers_dropped == 1
+    assert sub.cursor == 10
+    fanout.close()
+
+
+@pytest.mark.parametrize('slack, kept', [(1, 2), (0, 2), (-1, 1)])
+def test_drop_oldest_by_bytes_keeps_what_fits(slack, kept):
+    # Seqs 11-20 all have two digits, so every frame is the same size
+    size = frame_size(20)
+    fanout, sub = published(10, after=10, max_messages=None, max_bytes=2 * size + slack,
+                            on_overflow='drop-oldest')
+    events = sub.read(timeout=0)
+    assert [seq for seq, _ in events] == list(range(21 - kept, 21))
+    assert sum(len(frame) for _, frame in events) <= 2 * size + slack
+    assert fanout.dropped_messages == 10 - kept
+    assert sub.cursor == 20
+    fanout.close()
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from agent_chatroom.rooms import Room
+from agent_chatroom.server import history_body, history_page
+from agent_chatroom.store import RetentionPolicy, RingBufferStore
+
+
+@pytest.fixture
+def room():
+    # Seqs 1-12 posted, 8-12 retained
+    room = Room('default', 'pw', RingBufferStore(RetentionPolicy(max_count=5)))
+    room.store.extend([b'{"text": "hi"}'] * 12)
+    return room
+
+
+def page(room, after_seq=0, before_seq=None, limit=None, tail=None):
+    body = json.loads(history_body(*history_page(room, after_seq, before_seq, limit, tail)))
+    return [message['seq'] for message in body['messages']], body
+
+
+def test_limit_pages_forward_with_next(room):
+    seqs, body = page(room, limit=2)
+    assert seqs == [8, 9]
+    assert (body['next'], body['prev'], body['last_seq']) == (9, 8, 12)
+    seen = seqs
+    while True:
+        seqs, body = page(room, after_seq=body['next'], limit=2)
+        if not seqs:
+            break
+        seen += seqs
+    assert seen == [8, 9, 10, 11, 12]
+    assert (body['next'], body['prev']) == (12, None)
+
+
+def test_tail_pages_backward_with_prev(room):
+    seqs, body = page(room, tail=2)
+    assert seqs == [11, 12]
+    seen = seqs
+    while body['prev'] is not None:
+        seqs, body = page(room, before_seq=body['prev'], tail=2)
+        seen = seqs + seen
+    assert seen == [8, 9, 10, 11, 12]
+
+
+def test_before_seq_past_evicted_history(room):
+    seqs, body = page(room, before_seq=9, tail=3)
+    assert seqs == [8]
+    seqs, body = page(room, before_seq=5, tail=3)
+    assert seqs == []
+    assert body['prev'] is None
+    # Nothing newer is skipped: the cursor stays where it was
+    assert body['next'] == 0
+    seqs, body = page(room, before_seq=5, limit=3)
+    assert (seqs, body['next']) == ([], 0)
+
+
+def test_tail_with_after_seq_takes_the_newest_past_the_cursor(room):
+    assert page(room, after_seq=9, tail=2)[0] == [11, 12]
+    assert page(room, after_seq=10, tail=5)[0] == [11, 12]
+    assert page(room, after_seq=8, before_seq=12, tail=2)[0] == [10, 11]
+    seqs, body = page(room, after_seq=12, tail=2)
+    assert (seqs, body['next'], body['prev']) == ([], 12, None)
+
+
+def test_cursor_from_before_evictions_or_ahead_of_the_room(room):
+    seqs, body = page(room, after_seq=3, limit=2)
+    assert seqs == [8, 9]
+    seqs, body = page(room, after_seq=50, limit=2)
+    # A cursor from before a restart is pulled back to the room's last seq
+    assert (seqs, body['next']) == ([], 12)
+
+
+def test_unpaged_read_has_no_links(room):
+    seqs, body = page(room, after_seq=10)
+    assert seqs == [11, 12]
+    assert 'next' not in body
@@ -0,0 +1,44 @@
+import threading
+
+from agent_chatroom.ingest import IngestPipeline
+
+
+def commit_order(submissions, weights=None):
+    """Commit ``submissions`` of `(agent, n)` items one per batch, while the
+    first one holds the ingest thread; return the order they committed in."""
+    entered, release = threading.Event(), threading.Event()
+    order = []
+
+    def commit(items):
+        entered.set()
+        release.wait()
+        order.extend(items)
+        return items
+
+    pipeline = IngestPipeline(commit, window=0, max_batch=1,
+                              key=lambda item: item[0], weights=weights)
+    done = threading.Semaphore(0)
+    pipeline.submit_nowait(submissions[0], lambda result, error: done.release())
+    entered.wait()
+    for item in submissions[1:]:
+        pipeline.submit_nowait(item, lambda result, error: done.release())
+    release.set()
+    for _ in submissions:
+        done.acquire()
+    pipeline.close()
+    return order
+
+
+def test_quiet_agent_is_not_stuck_behind_a_backlog():
+    loud = [('loud', i) for i in range(20)]
+    order = commit_order(loud + [('quiet', 0)])
+    # One turn of loud's backlog at most, not all 19 queued behind it
+    assert order.index(('quiet', 0)) <= 2
+    assert [item for item in order if item[0] == 'loud'] == loud
+
+
+def test_weights_set_each_agent_share_per_turn():
+    submissions = [('a', i) for i in range(7)] + [('b', i) for i in range(6)]
+    order = commit_order(submissions, weights={'a': 2})
+    agents = ''.join(agent for agent, _ in order[1:])
+    assert agents.startswith('aabaab')
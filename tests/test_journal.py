@@ -0,0 +1,57 @@
+from agent_chatroom.journal import Journal, journal_epoch, load_journal
+from agent_chatroom.store import RetentionPolicy, RingBufferStore, StoredMessage
+
+
+def line(seq):
+    return b'{"seq": %d, "agent": "a", "text": "m%d"}\n' % (seq, seq)
+
+
+def replayed(path, keep=None):
+    store = RingBufferStore(RetentionPolicy(max_count=keep or 100))
+    count = load_journal(str(path), store, keep=keep)
+    return count, [entry.seq for entry in store.read()]
+
+
+def test_epoch_is_kept_with_the_journal(tmp_path):
+    path = str(tmp_path / 'room.jsonl')
+    fresh = journal_epoch(path)
+    # Nothing journaled yet, so nothing can have been cached under it
+    assert journal_epoch(path) != fresh
+
+    epoch = journal_epoch(path)
+    journal = Journal(path)
+    journal.append([StoredMessage(1, b'{"seq": 1, "text": "hi"}', 0.0)])
+    journal.close()
+    assert journal_epoch(path) == epoch
+
+
+def test_replay_restores_journaled_entries(tmp_path):
+    path = tmp_path / 'room.jsonl'
+    journal = Journal(str(path))
+    journal.append([StoredMessage(seq, line(seq).rstrip(), 0.0) for seq in (1, 2, 5)])
+    journal.close()
+    assert replayed(path) == (3, [1, 2, 5])
+
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    path = tmp_path / 'room.jsonl'
+    path.write_bytes(line(1) + line(2) + line(3) + b'{"seq": 4, "agent": "a", "te')
+    assert replayed(path) == (3, [1, 2, 3])
+    assert path.read_bytes() == line(1) + line(2) + line(3)
+
+
+def test_damaged_line_inside_the_journal_is_skipped(tmp_path):
+    path = tmp_path / 'room.jsonl'
+    path.write_bytes(line(1) + b'garbage\n' + line(2) + line(2) + line(3))
+    assert replayed(path) == (3, [1, 2, 3])
+
+
+def test_long_journal_is_compacted_on_load(tmp_path):
+    path = tmp_path / 'room.jsonl'
+    path.write_bytes(b''.join(line(seq) for seq in range(1, 11)))
+    assert replayed(path, keep=3) == (3, [8, 9, 10])
+    assert path.read_bytes() == line(8) + line(9) + line(10)
+    # Within twice the retention, the journal is left as it is
+    path.write_bytes(b''.join(line(seq) for seq in range(1, 11)))
+    assert replayed(path, keep=5) == (5, [6, 7, 8, 9, 10])
+    assert path.read_bytes() == b''.join(line(seq) for seq in range(1, 11))
@@ -0,0 +1,45 @@
+from agent_chatroom.compression import encoded_etag
+from agent_chatroom.pages import PAGE_SIZE
+from agent_chatroom.rooms import Room
+from agent_chatroom.server import page_response
+
+
+def sealed_page_cache(password):
+    room = Room('default', password)
+    room.store.extend([b'{"text": "hi"}'] * (PAGE_SIZE + 1))
+    status, _, headers = page_response(room, '/messages/pages/0', {'epoch': [room.pages.epoch]})
+    assert status == 200
+    return dict(headers)['Cache-Control']
+
+
+def test_sealed_pages_of_password_rooms_are_private():
+    assert sealed_page_cache('pw').startswith('private,')
+    assert sealed_page_cache('').startswith('public,')
+
+
+def room_with_page():
+    room = Room('default', '')
+    room.store.extend([b'{"text": "hi"}'] * PAGE_SIZE)
+    _, _, headers = page_response(room, '/messages/pages/0', {})
+    return room, dict(headers)['ETag']
+
+
+def test_matching_tag_gets_304():
+    room, etag = room_with_page()
+    status, body, headers = page_response(room, '/messages/pages/0', {}, f'"other", {etag}')
+    assert (status, body, dict(headers)['ETag']) == (304, b'', etag)
+
+
+def test_compressed_tag_matches_only_its_coding():
+    room, etag = room_with_page()
+    gzip_tag = encoded_etag(etag, 'gzip')
+    status, _, headers = page_response(room, '/messages/pages/0', {}, '', 'gzip')
+    assert dict(headers)['ETag'] == gzip_tag
+    assert page_response(room, '/messages/pages/0', {}, gzip_tag, 'gzip')[0] == 304
+    assert page_response(room, '/messages/pages/0', {}, gzip_tag)[0] == 200
+    assert page_response(room, '/messages/pages/0', {}, gzip_tag, 'deflate')[0] == 200
+
+
+def test_identity_tag_matches_any_coding():
+    room, etag = room_with_page()
+    assert page_response(room, '/messages/pages/0', {}, etag, 'gzip')[0] == 304
@@ -0,0 +1,19 @@
+from agent_chatroom.ratelimit import RateLimiter, RateLimits
+
+
+def test_refused_post_is_not_charged():
+    limiter = RateLimiter(RateLimits(agent_rate=0.001, agent_burst=1, ip_rate=0.001, ip_burst=3))
+    assert limiter.check('default', ['a'], '10.0.0.1') == 0
+    # Agent a is out of tokens, so its post must not cost the address anything
+    for _ in range(5):
+        assert limiter.check('default', ['a'], '10.0.0.1') > 0
+    assert limiter.check('default', ['b'], '10.0.0.1') == 0
+    assert limiter.check('default', ['c'], '10.0.0.1') == 0
+    assert limiter.check('default', ['d'], '10.0.0.1') > 0
+
+
+def test_refused_batch_charges_no_agent():
+    limiter = RateLimiter(RateLimits(agent_rate=0.001, agent_burst=1))
+    assert limiter.check('default', ['a'], '10.0.0.1') == 0
+    assert limiter.check('default', ['b', 'a'], '10.0.0.1') > 0
+    assert limiter.check('default', ['b'], '10.0.0.1') == 0
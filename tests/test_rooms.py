@@ -0,0 +1,99 @@
+import gc
+import os
+import threading
+import time
+import weakref
+
+import pytest
+
+from agent_chatroom.fanout import Lagged, SubscriberLimits
+from agent_chatroom.journal import Journal
+from agent_chatroom.rooms import Room, RoomExists, RoomRegistry
+
+
+def journaled_room(room_id, password, journal_path=None, epoch=None):
+    journal = Journal(journal_path) if journal_path else None
+    return Room(room_id, password, journal=journal, epoch=epoch)
+
+
+def wait_for_threads(count, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while threading.active_count() > count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return threading.active_count()
+
+
+def test_evicted_rooms_are_freed(tmp_path):
+    registry = RoomRegistry(journaled_room, state_dir=str(tmp_path), idle_timeout=3600)
+    threads_before = threading.active_count()
+    refs = []
+    for i in range(20):
+        room = registry.create(f'r{i}', 'pw')
+        room.ingest.submit(('a', b'{"agent": "a", "text": "hi"}', 'a: hi'))
+        refs.append(weakref.ref(room))
+    del room
+    assert threading.active_count() > threads_before + 20
+
+    for room in registry:
+        room.last_active = 0.0
+    del room
+    assert registry.evict_idle() == 20
+    gc.collect()
+
+    assert [ref for ref in refs if ref() is not None] == []
+    # Only the registry's sweeper thread remains
+    assert wait_for_threads(threads_before + 1) <= threads_before + 1
+
+
+def test_removed_room_is_freed(tmp_path):
+    registry = RoomRegistry(journaled_room, state_dir=str(tmp_path))
+    threads_before = threading.active_count()
+    room = registry.create('gone', 'pw')
+    room.ingest.submit(('a', b'{"agent": "a", "text": "hi"}', 'a: hi'))
+    ref = weakref.ref(room)
+    del room
+
+    assert registry.remove('gone')
+    gc.collect()
+
+    assert ref() is None
+    assert wait_for_threads(threads_before) == threads_before
+
+
+def test_concurrent_creates_of_one_room(tmp_path):
+    registry = RoomRegistry(journaled_room, state_dir=str(tmp_path))
+    barrier = threading.Barrier(8)
+    created, errors = [], []
+
+    def create(password):
+        barrier.wait()
+        try:
+            created.append(registry.create('race', password))
+        except RoomExists:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=create, args=(f'pw{i}',)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(created) == 1
+    assert registry.get('race') is created[0]
+    assert sorted(os.listdir(tmp_path)) == ['race.json', 'race.jsonl']
+    created[0].close()
+
+
+def test_live_subscription_starts_after_replayed_history():
+    room = Room('default', '', subscriber_limits=SubscriberLimits(max_messages=2))
+    # As a journal replay leaves it: stored, never published
+    room.store.extend([b'{"text": "old"}'] * 5)
+    sub = room.subscribe()
+    assert sub.cursor == 5
+    room.commit([('a', b'{"text": "new"}', '')] * 3)
+    assert room.fanout.wait(7, timeout=2)
+    with pytest.raises(Lagged):
+        sub.read(timeout=0)
+    assert [entry.seq for entry in room.store.read(sub.cursor)] == [6, 7, 8]
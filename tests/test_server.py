@@ -0,0 +1,96 @@
+import argparse
+import http.client
+import json
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from agent_chatroom.pool import ConnectionLimits
+from agent_chatroom.server import (
+    MAX_POLL_WAIT, ChatHandler, ThreadedHTTPServer, add_serve_arguments, check_serve_args,
+    new_message, new_messages, parse_wait,
+)
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', '-1', 'soon'])
+def test_parse_wait_rejects_bad_values(value):
+    with pytest.raises(ValueError):
+        parse_wait({'wait': [value]})
+
+
+def test_parse_wait_caps_the_wait():
+    assert parse_wait({}) == 0
+    assert parse_wait({'wait': ['1.5']}) == 1.5
+    assert parse_wait({'wait': ['1e9']}) == MAX_POLL_WAIT
+
+
+@pytest.fixture
+def threaded_server():
+    limits = ConnectionLimits(threads=2, backlog=4, max_streams=2)
+    srv = ThreadedHTTPServer(('127.0.0.1', 0), ChatHandler, limits)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_idle_connections_do_not_hold_workers(threaded_server):
+    port = threaded_server.server_address[1]
+    limits = threaded_server.limits
+    idle = [socket.create_connection(('127.0.0.1', port))
+            for _ in range(limits.threads + limits.max_streams)]
+    try:
+        time.sleep(0.2)
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=3) as response:
+            assert response.status == 200
+    finally:
+        for sock in idle:
+            sock.close()
+
+
+def test_keep_alive_connection_serves_several_requests(threaded_server):
+    conn = http.client.HTTPConnection('127.0.0.1', threaded_server.server_address[1], timeout=3)
+    for _ in range(3):
+        conn.request('GET', '/health')
+        response = conn.getresponse()
+        assert response.status == 200
+        response.read()
+    conn.close()
+
+
+def serve_args(*argv):
+    parser = argparse.ArgumentParser()
+    add_serve_arguments(parser)
+    args = parser.parse_args(['--password', 'pw', *argv])
+    check_serve_args(parser, args)
+    return args
+
+
+@pytest.mark.parametrize('argv', [
+    ['--room-idle', '60'],
+    ['--state-dir', 'rooms', '--room-idle', '0'],
+    ['--state-dir', 'rooms', '--workers', '2'],
+    ['--max-messages', '0'],
+    ['--stream-coalesce', '-1'],
+    ['--threads', '0'],
+    ['--agent-rate', '0'],
+])
+def test_serve_rejects_unusable_options(argv, capsys):
+    with pytest.raises(SystemExit):
+        serve_args(*argv)
+    assert 'error:' in capsys.readouterr().err
+
+
+def test_serve_accepts_defaults():
+    assert serve_args('--state-dir', 'rooms', '--room-idle', '60').room_idle == 60
+
+
+@pytest.mark.parametrize('agent', [{'x': 1}, ['a'], 7, None])
+def test_message_agent_must_be_a_string(agent):
+    with pytest.raises(ValueError, match='Agent must be a string'):
+        new_message(json.dumps({'agent': agent, 'text': 'hi'}).encode())
+    with pytest.raises(ValueError, match='Message 1: Agent must be a string'):
+        new_messages(json.dumps([{'text': 'ok'}, {'agent': agent, 'text': 'hi'}]).encode())
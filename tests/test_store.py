@@ -0,0 +1,80 @@
+import pytest
+
+from agent_chatroom import store as store_module
+from agent_chatroom.store import MessageStore, RetentionPolicy, RingBufferStore, StoredMessage
+
+DATA = b'{"text": "hi"}'
+
+
+def seqs(entries):
+    return [entry.seq for entry in entries]
+
+
+def test_message_store_is_abstract():
+    with pytest.raises(TypeError):
+        MessageStore()
+
+
+def test_max_count_evicts_the_oldest():
+    store = RingBufferStore(RetentionPolicy(max_count=3))
+    store.extend([DATA] * 5)
+    assert seqs(store.read()) == [3, 4, 5]
+    assert (store.first_seq, store.last_seq, len(store)) == (3, 5, 3)
+    assert store.stats()['evicted'] == 2
+
+
+def test_max_bytes_evicts_until_under_the_cap():
+    store = RingBufferStore(RetentionPolicy(max_count=10))
+    size = store.append(DATA).size
+    store = RingBufferStore(RetentionPolicy(max_count=10, max_bytes=2 * size))
+    store.extend([DATA] * 4)
+    assert seqs(store.read()) == [3, 4]
+    assert store.stats()['bytes'] == 2 * size
+    assert store.stats()['evicted_bytes'] == 2 * size
+
+
+def test_max_age_evicts_on_read(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(store_module.time, 'time', lambda: now[0])
+    store = RingBufferStore(RetentionPolicy(max_count=10, max_age=10))
+    store.append(DATA)
+    now[0] += 5
+    store.append(DATA)
+    now[0] += 6
+    assert seqs(store.read()) == [2]
+    assert store.first_seq == 2
+    now[0] += 10
+    assert store.read() == []
+    assert (store.first_seq, store.last_seq) == (3, 2)
+
+
+def test_insert_keeps_seq_gaps():
+    store = RingBufferStore(RetentionPolicy(max_count=10))
+    store.insert(StoredMessage(2, DATA, 0.0))
+    store.insert(StoredMessage(5, DATA, 0.0))
+    assert seqs(store.read()) == [2, 5]
+    assert seqs(store.read(limit=1)) == [2]
+    assert seqs(store.tail(1)) == [5]
+    assert store.append(DATA).seq == 6
+    with pytest.raises(ValueError):
+        store.insert(StoredMessage(6, DATA, 0.0))
+
+
+def test_insert_gap_pushes_old_entries_out_of_the_ring():
+    store = RingBufferStore(RetentionPolicy(max_count=3))
+    store.extend([DATA] * 3)
+    store.insert(StoredMessage(5, DATA, 0.0))
+    # Seqs 3-5 fit the ring; 4 was never stored
+    assert seqs(store.read()) == [3, 5]
+    assert (store.first_seq, len(store)) == (3, 2)
+    assert store.stats()['evicted'] == 2
+
+
+def test_insert_far_past_capacity_starts_over():
+    store = RingBufferStore(RetentionPolicy(max_count=3))
+    store.extend([DATA] * 2)
+    store.insert(StoredMessage(100, DATA, 0.0))
+    assert seqs(store.read()) == [100]
+    assert (store.first_seq, store.last_seq, len(store)) == (100, 100, 1)
+    assert store.append(DATA).seq == 101
+    assert seqs(store.read(after_seq=50)) == [100, 101]